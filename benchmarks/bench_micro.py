@@ -0,0 +1,286 @@
+"""
+客户端热点代码的微基准（不发任何网络请求，全部使用合成数据）。
+
+覆盖整批账号运行中会执行成千上万次的本地代码:
+- request():       构造请求体 + json.dumps（_send 替换为返回固定响应）
+- get_tasks():     任务列表响应解析
+- get_my_cards():  myCard 响应解析（40 张卡 + 里程碑）
+- giftable/missing: 可赠送 / 缺少的卡片计算
+- plan_gift:       互赠规划
+- parse_accounts:  解析 1 万行 NARAKA_TOKEN
+- inventory:       1000 个账号写入库存矩阵并统计
+
+用法:
+    python benchmarks/bench_micro.py                 # 运行并打印结果
+    python benchmarks/bench_micro.py --save          # 运行并写入基线 benchmarks/baseline.json
+    python benchmarks/bench_micro.py --compare       # 与基线比较，慢于阈值的项返回非 0
+    python benchmarks/bench_micro.py --compare --threshold 0.1 -k parse
+
+基线与机器相关：换机器或升级 Python 后先用 --save 重新生成。
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_FILE = os.path.join(ROOT, "benchmarks", "baseline.json")
+sys.path.insert(0, ROOT)
+
+import luck_draw_api as api  # noqa: E402
+
+
+# =============================================================================
+# 合成数据
+# =============================================================================
+CARD_COUNT = 40
+
+
+def card_infos(seed: int) -> List[Dict[str, Any]]:
+    return [
+        {"id": f"card{i:02d}", "name": f"卡片{i}", "num": (seed * 7 + i * 3) % 4, "image": "https://x/" + "a" * 60}
+        for i in range(CARD_COUNT)
+    ]
+
+
+def milepost_infos() -> List[Dict[str, Any]]:
+    return [
+        {"nodeId": f"node{n}", "title": f"集齐{n}张", "state": "UN_COMPLETE",
+         "prizeList": [{"prizeName": f"奖品{n}"}]}
+        for n in (5, 10, 20, 30, 40)
+    ]
+
+
+def task_list() -> List[Dict[str, Any]]:
+    titles = ["访问活动", "每日登录", "送出卡片", "分享活动", "浏览帖子", "完成对局"]
+    return [
+        {"asId": f"task{i}", "title": t, "completed": i % 2 == 0, "alreadyGot": i % 3 == 0,
+         "desc": "描述" * 20, "prizeList": [{"prizeName": "抽奖机会"}]}
+        for i, t in enumerate(titles)
+    ]
+
+
+RESPONSES = {
+    "/v1/miniapp/act/task/taskInfo": {"code": 200, "result": {"taskList": task_list()}},
+    "/v1/miniapp/act/module/interchgCard/myCard": {
+        "code": 200, "result": {"cardInfos": card_infos(1), "milepostInfos": milepost_infos()},
+    },
+}
+
+
+class OfflineBot(api.DSAutomator):
+    """_send 直接返回固定响应，只测量本地处理"""
+
+    def _send(self, method: str, endpoint: str, body_str: str) -> Dict[str, Any]:
+        return RESPONSES.get(endpoint) or {"code": 200, "result": {}}
+
+
+def make_bot(idx: int = 0) -> OfflineBot:
+    activity = api.ActivityContext.from_spec(
+        ("book1", "d90", "act" + "x" * 24, "cardas" + "x" * 20, "drawas" + "x" * 20, ["taskas1", "taskas2"])
+    )
+    bot = OfflineBot(f"token{idx}" * 4, f"uid{idx:08d}", f"device{idx}", f"acc{idx}", activity)
+    role = api.Role("d90", f"role{idx:012d}", "s1", f"角色{idx}", 60, "国服", "https://x/icon.png", 1700000000000)
+    bot._role_list = [role]
+    bot._update_from_role(role)
+    bot._initialized = True
+    return bot
+
+
+# =============================================================================
+# 基准项：每项返回一个无参函数
+# =============================================================================
+def bench_request() -> Callable[[], Any]:
+    bot = make_bot()
+    body = {
+        "actId": bot.act_id, "asType": api.AS_TYPE_TASK, "asIdList": ["taskas1"],
+        **bot._build_act_role_info(), "visibleOSType": "ANDROID", "visiblePrdType": "MINI_PROGRAM",
+    }
+    return lambda: bot.request("POST", "/v1/miniapp/act/task/applyTaskPrize", body)
+
+
+def bench_get_tasks() -> Callable[[], Any]:
+    return make_bot().get_tasks
+
+
+def bench_get_my_cards() -> Callable[[], Any]:
+    return make_bot().get_my_cards
+
+
+def bench_giftable_missing() -> Callable[[], Any]:
+    snapshot = api.CardSnapshot.from_raw({"cardInfos": card_infos(2)})
+    return lambda: (snapshot.giftable(), snapshot.missing())
+
+
+def bench_plan_gift() -> Callable[[], Any]:
+    a, b = make_bot(1), make_bot(2)
+    a_cards = api.CardSnapshot.from_raw({"cardInfos": card_infos(1)})
+    b_cards = api.CardSnapshot.from_raw({"cardInfos": card_infos(2)})
+    a_giftable, b_missing = a_cards.giftable(), b_cards.missing()
+    return lambda: api.plan_gift(a, b, a_giftable, b_missing)
+
+
+def bench_parse_accounts() -> Callable[[], Any]:
+    value = "&".join(f"token{i:06d}{'t' * 40}#uid{i:06d}#device{i:06d}#账号{i}" for i in range(10000))
+
+    def run():
+        old = os.environ.get("NARAKA_TOKEN")
+        os.environ["NARAKA_TOKEN"] = value
+        try:
+            return api.parse_accounts_from_env()
+        finally:
+            if old is None:
+                del os.environ["NARAKA_TOKEN"]
+            else:
+                os.environ["NARAKA_TOKEN"] = old
+    return run
+
+
+def bench_inventory() -> Callable[[], Any]:
+    rows = [(f"acc{i}", api.CardSnapshot.from_raw({"cardInfos": card_infos(i)}).cards) for i in range(1000)]
+
+    def run():
+        matrix = api.InventoryMatrix()
+        for account, cards in rows:
+            matrix.add(account, cards)
+        return matrix.card_stats(), matrix.account_stats()
+    return run
+
+
+BENCHMARKS: Dict[str, Callable[[], Callable[[], Any]]] = {
+    "request": bench_request,
+    "get_tasks": bench_get_tasks,
+    "get_my_cards": bench_get_my_cards,
+    "giftable_missing": bench_giftable_missing,
+    "plan_gift": bench_plan_gift,
+    "parse_accounts_10k": bench_parse_accounts,
+    "inventory_1k": bench_inventory,
+}
+
+
+# =============================================================================
+# 计时与基线
+# =============================================================================
+def timeit(fn: Callable[[], Any], repeat: int = 7, round_time: float = 0.1) -> float:
+    """返回单次调用耗时（微秒）：每轮至少 round_time 秒，取多轮中最快的一轮，计时期间关闭 GC"""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        if time.perf_counter() - start >= round_time / 4 or loops >= 1 << 22:
+            break
+        loops *= 2
+    loops *= 4
+    best = float("inf")
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            best = min(best, (time.perf_counter() - start) / loops)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best * 1e6
+
+
+def run_all(pattern: str) -> Dict[str, float]:
+    api.LOG.level = api.RunLog.LEVELS["ERROR"]
+    results = {}
+    for name, factory in BENCHMARKS.items():
+        if pattern and pattern not in name:
+            continue
+        results[name] = timeit(factory())
+    return results
+
+
+def load_baseline() -> Dict[str, Any]:
+    try:
+        with open(BASELINE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baseline(results: Dict[str, float]) -> None:
+    data = load_baseline()
+    data.setdefault("results", {}).update({k: round(v, 3) for k, v in results.items()})
+    data["python"] = platform.python_version()
+    data["machine"] = platform.machine()
+    with open(BASELINE_FILE, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def recheck(results: Dict[str, float], threshold: float, rounds: int = 2) -> None:
+    """疑似回归的项重新计时（取最快），排除偶发的机器抖动"""
+    base = load_baseline().get("results") or {}
+    for _ in range(rounds):
+        suspects = [n for n, v in results.items() if base.get(n) and v / base[n] - 1 > threshold]
+        if not suspects:
+            return
+        for name in suspects:
+            results[name] = min(results[name], timeit(BENCHMARKS[name]()))
+
+
+def compare(results: Dict[str, float], threshold: float) -> List[Tuple[str, float]]:
+    """打印与基线的对比，返回慢于阈值的项 [(名称, 变化比例)]"""
+    baseline = load_baseline()
+    base_results = baseline.get("results") or {}
+    if baseline.get("python") and baseline["python"] != platform.python_version():
+        print(f"[提示] 基线由 Python {baseline['python']} 生成，当前为 {platform.python_version()}")
+    regressions = []
+    print(f"{'基准':<22}{'基线(us)':>12}{'本次(us)':>12}{'变化':>10}")
+    for name, value in results.items():
+        base = base_results.get(name)
+        if not base:
+            print(f"{name:<22}{'-':>12}{value:>12.2f}{'新增':>10}")
+            continue
+        change = value / base - 1
+        flag = "  <-- 变慢" if change > threshold else ""
+        print(f"{name:<22}{base:>12.2f}{value:>12.2f}{change:>+9.1%}{flag}")
+        if change > threshold:
+            regressions.append((name, change))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="客户端热点代码微基准")
+    parser.add_argument("--save", action="store_true", help="把本次结果写入基线")
+    parser.add_argument("--compare", action="store_true", help="与基线比较，有项目变慢超过阈值时返回 1")
+    parser.add_argument("--threshold", type=float, default=0.25, help="回归阈值（相对基线的变慢比例，默认 0.25）")
+    parser.add_argument("-k", dest="pattern", default="", help="只运行名称包含该字符串的基准")
+    args = parser.parse_args()
+
+    results = run_all(args.pattern)
+    if args.save:
+        # 基线取三次完整运行中最快的结果
+        for _ in range(2):
+            for name, value in run_all(args.pattern).items():
+                results[name] = min(results[name], value)
+    if args.compare:
+        recheck(results, args.threshold)
+        regressions = compare(results, args.threshold)
+        if regressions:
+            print(f"\n[回归] {len(regressions)} 项慢于基线 {args.threshold:.0%} 以上: "
+                  + ", ".join(f"{n}({c:+.0%})" for n, c in regressions))
+            return 1
+        print(f"\n[通过] 没有慢于基线 {args.threshold:.0%} 以上的项")
+    else:
+        for name, value in results.items():
+            print(f"{name:<22}{value:>12.2f} us")
+    if args.save:
+        save_baseline(results)
+        print(f"\n[基线] 已保存: {BASELINE_FILE}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
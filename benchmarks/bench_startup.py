@@ -0,0 +1,82 @@
+"""
+启动耗时基准：每次在全新的解释器里测量，反映青龙定时任务 / 频繁短命令的真实冷启动开销。
+
+测量项:
+1. python -c pass              —— 解释器本身的启动耗时（基线）
+2. import luck_draw_api        —— 导入脚本模块
+3. luck_draw_api.py status     —— 未配置 NARAKA_TOKEN 时的完整命令（解析参数后立即退出）
+
+同时检查导入脚本后 requests / notify / numpy 是否被提前加载。
+
+用法: python benchmarks/bench_startup.py [-n 重复次数]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = os.path.join(ROOT, "luck_draw_api.py")
+HEAVY_MODULES = ("requests", "notify", "numpy")
+
+CASES = [
+    ("解释器启动", [sys.executable, "-c", "pass"]),
+    ("导入模块", [sys.executable, "-c", "import luck_draw_api"]),
+    ("status (未配置账号)", [sys.executable, SCRIPT, "status"]),
+]
+
+
+def clean_env() -> dict:
+    env = {k: v for k, v in os.environ.items() if not k.startswith("NARAKA_")}
+    env["PYTHONPATH"] = ROOT
+    env["PYTHONDONTWRITEBYTECODE"] = "1"
+    return env
+
+
+def measure(cmd, repeat: int, env: dict) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def loaded_heavy_modules(env: dict) -> list:
+    code = (
+        "import sys, luck_draw_api; "
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    out = subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT,
+                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True).stdout
+    return [m for m in out.strip().split(",") if m]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="测量脚本冷启动耗时")
+    parser.add_argument("-n", "--repeat", type=int, default=20, help="每项重复次数（默认 20）")
+    args = parser.parse_args()
+
+    env = clean_env()
+    # 预热一次，排除首次编译 .pyc / 磁盘缓存的影响
+    for _, cmd in CASES:
+        measure(cmd, 1, env)
+
+    base = None
+    print(f"{'项目':<20}{'中位数':>10}{'最小':>10}{'最小-解释器':>12}")
+    for name, cmd in CASES:
+        samples = measure(cmd, args.repeat, env)
+        median, fastest = statistics.median(samples), min(samples)
+        if base is None:
+            base = fastest
+        print(f"{name:<20}{median:>8.1f}ms{fastest:>8.1f}ms{fastest - base:>10.1f}ms")
+
+    heavy = loaded_heavy_modules(env)
+    print(f"\n导入后已加载的重量级模块: {', '.join(heavy) if heavy else '无'}")
+    return 1 if heavy else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
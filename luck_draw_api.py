@@ -14,16 +14,18 @@ UID：对应 GL-Uid 的值
 DEVICE_ID：对应 GL-DeviceId 的值
 =============================================================================
 """
+import copy
 import json
+import sys
 import time
-import requests
+import threading
 import os
-from typing import Optional, List, Dict, Any, Tuple
+from array import array
+from contextlib import contextmanager
+from typing import Optional, List, Dict, Any, Tuple, Callable, NamedTuple
 
-try:
-    from notify import send as notify_send  # 青龙面板通知
-except Exception:
-    notify_send = None
+# requests、青龙 notify、NumPy 都在首次使用时才导入，
+# 未配置账号、只查看帮助等短命令不必承担它们的导入开销
 
 # =============================================================================
 # 模块类型常量（网易大神小程序固定协议）
@@ -38,25 +40,903 @@ AS_TYPE_CARD = "43"   # 集卡模块（API要求字符串格式）
 # 签名计算 API 地址（Cloudflare Worker）
 SIGN_API_URL = os.environ.get("NARAKA_SIGN_API_URL", "https://your-worker.workers.dev/api/sign")
 
-# 当前活动的卡册ID（可选；不填则脚本自动发现最新活动）
-CARD_BOOK_ID = os.environ.get("NARAKA_CARD_BOOK_ID", "").strip()
-_CARD_BOOK_ID_AUTO_LOGGED = False
+# 卡册ID（可选，多个用英文逗号分隔；不填则脚本自动发现所有进行中的活动）
+CARD_BOOK_IDS = [x.strip() for x in os.environ.get("NARAKA_CARD_BOOK_ID", "").split(",") if x.strip()]
 # 是否开启账号间互相送卡（True 开启，False 关闭）
 EXCHANGE_CARDS = os.environ.get("NARAKA_EXCHANGE_CARDS", "True").lower() == "true"
+# 库存报表导出路径（.csv 或 .json，可选）
+REPORT_FILE = os.environ.get("NARAKA_REPORT_FILE", "").strip()
+# 同时处理的账号数（默认 1，即逐个账号执行）
+WORKERS = max(1, int(os.environ.get("NARAKA_WORKERS", "1") or 1))
+# 所有账号合计的最大并发请求数（实际并发由自适应控制在此范围内调整）
+MAX_CONCURRENCY = max(1, int(os.environ.get("NARAKA_MAX_CONCURRENCY", "16") or 16))
+# 同一账号处理哪些游戏角色：不填只处理默认角色；all 为全部角色；
+# 或用英文逗号分隔的 roleId / 角色名 / 服务器（账号下没有匹配的角色时仍用默认角色）
+ROLES = [x.strip() for x in os.environ.get("NARAKA_ROLES", "").split(",") if x.strip()]
+# 多进程模式：账号按互赠配对分到 N 个子进程，每个子进程内仍按 NARAKA_WORKERS 并发（默认 0 不启用）
+PROCESSES = max(0, int(os.environ.get("NARAKA_PROCESSES", "0") or 0))
+# 运行时间预算（秒，可带 s/m/h 后缀；不填不限制），接近时停止开始新工作并正常收尾
+DEADLINE_BUDGET = os.environ.get("NARAKA_DEADLINE", "").strip()
+# 账号调度：auto（设置了时间预算且账号多于并发数时预扫描排序）/ live（总是预扫描）/ cache（只用缓存）/ off（按配置顺序）
+SCHEDULE_MODE = os.environ.get("NARAKA_SCHEDULE", "auto").strip().lower()
+# 性能分析模式（或命令行 --profile）：输出各阶段 CPU / 内存 / 耗时拆分，并保存合并的 pstats 文件
+PROFILE = os.environ.get("NARAKA_PROFILE", "").lower() in ("1", "true", "yes")
+PROFILE_OUT = os.environ.get("NARAKA_PROFILE_OUT", "").strip() or "naraka_profile.pstats"
+# 本地状态缓存文件（待领取的赠送、当日进度与扫描结果等，跨运行复用）
+STATE_FILE = os.environ.get("NARAKA_STATE_FILE", "").strip() or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "naraka_state.json"
+)
+# 日志格式：text（默认，按账号整块输出）/ json（JSON Lines，便于机器分析）
+LOG_FORMAT = os.environ.get("NARAKA_LOG_FORMAT", "text").strip().lower()
+# 日志级别：DEBUG / INFO（默认）/ WARNING / ERROR；逐次抽奖明细为 DEBUG
+LOG_LEVEL = os.environ.get("NARAKA_LOG_LEVEL", "INFO").strip().upper()
 # =============================================================================
 
 
+class RunLog:
+    """
+    运行日志：账号内的日志先写入缓冲，账号处理完再整块输出，并发时各账号输出不交错。
+    json 格式下每条日志输出一行 {"ts", "level", "account", "msg"}。
+    """
+
+    LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+    def __init__(self, level: str = "INFO", fmt: str = "text"):
+        self.level = self.LEVELS.get(level, 20)
+        self.json = fmt == "json"
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def _context(self) -> Tuple[Optional[List[str]], str]:
+        return getattr(self._local, "buffer", None), getattr(self._local, "account", "")
+
+    def _write(self, lines: List[str]) -> None:
+        if not lines:
+            return
+        with self._lock:
+            sys.stdout.write("\n".join(lines) + "\n")
+            sys.stdout.flush()
+
+    def log(self, level: str, msg: Any = "") -> None:
+        if self.LEVELS[level] < self.level:
+            return
+        buffer, account = self._context()
+        msg = str(msg)
+        if self.json:
+            msg = msg.strip("\n")
+            if not msg.strip("#=* "):  # 空行和分隔线只用于文本排版
+                return
+            line = json.dumps({
+                "ts": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "level": level.lower(),
+                "account": account,
+                "msg": msg,
+            }, ensure_ascii=False)
+        else:
+            line = msg
+        if buffer is not None:
+            buffer.append(line)
+        else:
+            self._write([line])
+
+    def debug(self, msg: Any = "") -> None:
+        self.log("DEBUG", msg)
+
+    def info(self, msg: Any = "") -> None:
+        self.log("INFO", msg)
+
+    def warning(self, msg: Any = "") -> None:
+        self.log("WARNING", msg)
+
+    def error(self, msg: Any = "") -> None:
+        self.log("ERROR", msg)
+
+    @contextmanager
+    def block(self, account: str):
+        """块内的日志缓冲起来，退出时整块输出（嵌套时并入外层块）"""
+        outer = self._context()
+        buffer: List[str] = []
+        self._local.buffer, self._local.account = buffer, account
+        try:
+            yield
+        finally:
+            self._local.buffer, self._local.account = outer
+            if outer[0] is not None:
+                outer[0].extend(buffer)
+            else:
+                self._write(buffer)
+
+    def bind(self, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        """让 fn 在其他线程中执行时写入当前线程的日志块"""
+        buffer, account = self._context()
+        if buffer is None:
+            return fn
+
+        def run(item):
+            self._local.buffer, self._local.account = buffer, account
+            try:
+                return fn(item)
+            finally:
+                self._local.buffer, self._local.account = None, ""
+        return run
+
+
+LOG = RunLog(LOG_LEVEL, LOG_FORMAT)
+
+
+class StateStore:
+    """
+    本地 JSON 状态缓存。
+    结构: {"activities": {cardBookId: {...}}, "accounts": {账号key: {cardBookId: {...}}}}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data: Optional[Dict[str, Any]] = None
+        self.lock = threading.RLock()
+
+    def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._data = json.load(f)
+            except (OSError, ValueError):
+                self._data = {}
+            self._data.setdefault("activities", {})
+            self._data.setdefault("accounts", {})
+        return self._data
+
+    def activity(self, card_book_id: str) -> Dict[str, Any]:
+        """返回活动级缓存（所有账号共享）"""
+        with self.lock:
+            return self._load()["activities"].setdefault(card_book_id, {})
+
+    def account(self, account_key: str, card_book_id: str) -> Dict[str, Any]:
+        """返回账号在某活动下的缓存"""
+        with self.lock:
+            return self._load()["accounts"].setdefault(account_key, {}).setdefault(card_book_id, {})
+
+    def save(self) -> None:
+        with self.lock:
+            if self._data is None:
+                return
+            tmp_path = self.path + ".tmp"
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._data, f, ensure_ascii=False, separators=(',', ':'))
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                LOG.warning(f"[状态缓存] 保存失败: {e}")
+
+    def snapshot(self, account_keys: List[str],
+                 card_book_ids: List[str]) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        导出指定账号的缓存，以及各活动中这些账号待领取的赠送。
+        用于子进程把结果交回父进程合并。
+        """
+        with self.lock:
+            data = self._load()
+            keys = set(account_keys)
+            ledger = {k: data["accounts"].get(k) or {} for k in keys}
+            activities = {}
+            for book_id in card_book_ids:
+                cache = data["activities"].get(book_id) or {}
+                activities[book_id] = {
+                    "pending_wishes": [w for w in cache.get("pending_wishes") or [] if w.get("receiver") in keys],
+                }
+            return ledger, activities
+
+    def merge(self, ledger: Dict[str, Any], activities: Dict[str, Any]) -> None:
+        """合并 snapshot() 导出的结果：账号缓存整体覆盖，这些账号的待领取赠送以导出方为准"""
+        with self.lock:
+            data = self._load()
+            for key, books in ledger.items():
+                if books:
+                    data["accounts"].setdefault(key, {}).update(books)
+            for book_id, incoming in activities.items():
+                cache = data["activities"].setdefault(book_id, {})
+                if "pending_wishes" in cache or incoming["pending_wishes"]:
+                    kept = [w for w in cache.get("pending_wishes") or [] if w.get("receiver") not in ledger]
+                    cache["pending_wishes"] = kept + incoming["pending_wishes"]
+
+
+STATE = StateStore(STATE_FILE)
+
+
+def run_concurrently(fn: Callable[[Any], Any], items: List[Any], max_workers: int = 8) -> List[Any]:
+    """并发执行 fn(item)，按输入顺序返回结果"""
+    if len(items) <= 1:
+        return [fn(item) for item in items]
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as pool:
+        return list(pool.map(PROFILER.bind(LOG.bind(fn)), items))
+
+
+class Step(NamedTuple):
+    """账号流程中的一个步骤；fn 接收已完成步骤的结果 {步骤名: 结果}"""
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]
+    deps: Tuple[str, ...] = ()
+    optional: bool = False  # 时间紧张时跳过，依赖它的步骤照常执行
+
+
+def _check_steps(steps: List[Step]) -> None:
+    """依赖必须存在且无环"""
+    names = {s.name for s in steps}
+    for s in steps:
+        missing = [d for d in s.deps if d not in names]
+        if missing:
+            raise ValueError(f"步骤 {s.name} 依赖不存在的步骤: {', '.join(missing)}")
+    done: set = set()
+    remaining = list(steps)
+    while remaining:
+        ready = [s for s in remaining if all(d in done for d in s.deps)]
+        if not ready:
+            raise ValueError("步骤存在循环依赖: " + ", ".join(s.name for s in remaining))
+        done.update(s.name for s in ready)
+        remaining = [s for s in remaining if s.name not in done]
+
+
+def run_steps(steps: List[Step], label: str) -> Dict[str, Any]:
+    """
+    按依赖关系执行步骤：依赖都已完成的步骤立即并发开始，只有真正的依赖才等待。
+    - 步骤出错时记录日志，依赖它的步骤不再执行，其余分支不受影响
+    - 时间预算用完时不再开始新步骤，跳过的步骤（含下游）记入汇总
+    返回已完成步骤的结果。
+    """
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    _check_steps(steps)
+    results: Dict[str, Any] = {}
+    failed: Dict[str, str] = {}  # 步骤名 -> "error" / "deadline"
+    pending = list(steps)
+    running: Dict[Any, Step] = {}
+
+    def skip(step: Step, reason: str) -> None:
+        failed[step.name] = reason
+        if reason == "deadline":
+            DEADLINE.skip(f"{label}: {step.name}")
+
+    with ThreadPoolExecutor(max_workers=max(1, len(steps))) as pool:
+        run = PROFILER.bind(LOG.bind(lambda step: step.fn(results)))
+        while pending or running:
+            progressed = False
+            for step in list(pending):
+                blocked = [failed[d] for d in step.deps if d in failed]
+                if blocked:
+                    pending.remove(step)
+                    skip(step, "deadline" if "deadline" in blocked else "error")
+                elif all(d in results for d in step.deps):
+                    pending.remove(step)
+                    if step.optional and DEADLINE.near():
+                        DEADLINE.skip(f"{label}: {step.name}")
+                        results[step.name] = None
+                    elif DEADLINE.expired():
+                        skip(step, "deadline")
+                    else:
+                        running[pool.submit(run, step)] = step
+                else:
+                    continue
+                progressed = True
+            if progressed or not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    results[step.name] = future.result()
+                except Exception as e:
+                    LOG.error(f"[{label}] {step.name}出错: {e}")
+                    failed[step.name] = "error"
+    return results
+
+
+# =============================================================================
+# 响应模型：接口返回只解析一次，只保留脚本用到的字段，原始 JSON 立即丢弃
+# =============================================================================
+
+
+class Card(NamedTuple):
+    id: str
+    name: str
+    num: int
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any]) -> "Card":
+        card_id = raw.get("id") or ""
+        return cls(card_id, raw.get("name") or card_id, int(raw.get("num") or 0))
+
+    @property
+    def can_give(self) -> int:
+        """可赠送数量（保留1张自用）"""
+        return max(self.num - 1, 0)
+
+
+class Milepost(NamedTuple):
+    node_id: str
+    title: str
+    state: str = ""  # RECEIVE=已领取, UN_RECEIVE=可领取, UN_COMPLETE=未达成
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any]) -> "Milepost":
+        return cls(raw.get("nodeId") or "", raw.get("title") or "", raw.get("state") or "")
+
+
+class CardSnapshot(NamedTuple):
+    """myCard 快照"""
+    cards: Tuple[Card, ...] = ()
+    mileposts: Tuple[Milepost, ...] = ()
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any]) -> "CardSnapshot":
+        return cls(
+            tuple(Card.from_raw(c) for c in raw.get("cardInfos") or [] if c),
+            tuple(Milepost.from_raw(m) for m in raw.get("milepostInfos") or [] if m),
+        )
+
+    @property
+    def owned(self) -> int:
+        """已拥有的卡片种类数"""
+        return sum(1 for c in self.cards if c.num > 0)
+
+    def giftable(self) -> List[Card]:
+        """可赠送的卡片（数量 > 1）"""
+        return [c for c in self.cards if c.num > 1]
+
+    def missing(self) -> List[Card]:
+        """缺少的卡片（数量 = 0）"""
+        return [c for c in self.cards if c.num == 0]
+
+
+class Task(NamedTuple):
+    as_id: str
+    title: str
+    completed: bool
+    already_got: bool
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any]) -> "Task":
+        return cls(raw.get("asId") or raw.get("id") or "", raw.get("title") or "",
+                   bool(raw.get("completed")), bool(raw.get("alreadyGot")))
+
+
+class CardBook(NamedTuple):
+    id: str
+    app_key: str
+    active: bool
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any], app_key: str = "", now_ms: int = 0) -> "CardBook":
+        base_info = raw.get("baseInfo") or {}
+        end_time = base_info.get("endTime") or 0
+        book_id = (base_info.get("id") or raw.get("id") or "").strip()
+        return cls(book_id, base_info.get("appKey") or raw.get("appKey") or app_key,
+                   bool(book_id) and (not end_time or end_time > now_ms))
+
+
+class Role(NamedTuple):
+    app_key: str
+    role_id: str
+    server: str
+    nick: str = ""
+    level: int = 0
+    server_name: str = ""
+    icon: str = ""
+    last_modified: int = 0
+
+    @classmethod
+    def from_raw(cls, raw: Dict[str, Any]) -> "Role":
+        return cls(
+            raw.get("appKey") or raw.get("app_key") or "",
+            raw.get("roleId") or raw.get("role_id") or "",
+            raw.get("server") or "",
+            raw.get("nick") or raw.get("roleName") or "",
+            raw.get("roleLevel") or raw.get("level") or 0,
+            raw.get("serverName") or raw.get("server_name") or "",
+            raw.get("icon") or "",
+            raw.get("lastModified") or 0,
+        )
+
+
+def _display_width(text: str) -> int:
+    """终端显示宽度（中文等全角字符占两列）"""
+    import unicodedata
+    return sum(2 if unicodedata.east_asian_width(ch) in ("W", "F") else 1 for ch in text)
+
+
+def format_row(cells: List[str], widths: List[int]) -> str:
+    """按显示宽度对齐一行表格：首列左对齐，其余右对齐"""
+    out = []
+    for i, (cell, width) in enumerate(zip(cells, widths)):
+        pad = " " * max(width - _display_width(cell), 0)
+        out.append(cell + pad if i == 0 else pad + cell)
+    return "".join(out)
+
+
+class PhaseProfiler:
+    """
+    分阶段性能分析（仅在开启后生效）。
+    - cProfile：统计进入阶段的线程的 CPU 调用
+    - tracemalloc：阶段内的内存峰值增量（进程级，并发阶段会相互叠加）
+    - 墙钟拆分：sleep / 并发等待 / 签名 / API I/O，其余计为本地处理
+    同一线程内嵌套的阶段只有最外层启用 cProfile，耗时同时计入内外两层。
+    经 run_concurrently / run_steps 分发到工作线程的耗时计入发起线程所在的阶段，
+    并发时各项累加，可能超过该阶段的墙钟。
+    """
+    CATEGORIES = ("sleep", "wait", "sign", "io")
+    LABELS = {"sleep": "sleep", "wait": "并发等待", "sign": "签名", "io": "API I/O"}
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = False
+        self._local = threading.local()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._profiles: Dict[str, List[Any]] = {}
+        self._active = 0
+        self._lock = threading.Lock()
+        if enabled:
+            self.enable()
+
+    def enable(self) -> None:
+        if not self.enabled:
+            import tracemalloc
+            tracemalloc.start()
+            self.enabled = True
+
+    def _stack(self) -> List[Dict[str, Any]]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextmanager
+    def phase(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        import cProfile
+        import tracemalloc
+        stack = self._stack()
+        frame: Dict[str, Any] = dict.fromkeys(self.CATEGORIES, 0.0)
+        profiler = None
+        if not any(f["profiler"] for f in stack):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ 同一时间只允许一个 cProfile，并发阶段只统计耗时
+                profiler = None
+        frame["profiler"] = profiler
+        with self._lock:
+            if not self._active and hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+            self._active += 1
+        mem_start = tracemalloc.get_traced_memory()[0]
+        stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - started
+            stack.pop()
+            if profiler:
+                profiler.disable()
+            mem_peak = tracemalloc.get_traced_memory()[1] - mem_start
+            with self._lock:
+                self._active -= 1
+                st = self._stats.setdefault(name, dict.fromkeys(("calls", "wall", "mem_peak") + self.CATEGORIES, 0.0))
+                st["calls"] += 1
+                st["wall"] += wall
+                st["mem_peak"] = max(st["mem_peak"], mem_peak)
+                for c in self.CATEGORIES:
+                    st[c] += frame[c]
+                if profiler:
+                    self._profiles.setdefault(name, []).append(profiler)
+                if stack:
+                    for c in self.CATEGORIES:
+                        stack[-1][c] += frame[c]
+
+    def add(self, category: str, seconds: float) -> None:
+        """把一段耗时计入当前线程所在阶段"""
+        if self.enabled:
+            stack = self._stack()
+            if stack:
+                with self._lock:
+                    stack[-1][category] += seconds
+
+    def bind(self, fn: Callable[[Any], Any]) -> Callable[[Any], Any]:
+        """让 fn 在其他线程中执行时的耗时计入当前线程所在阶段"""
+        stack = self._stack() if self.enabled else None
+        if not stack:
+            return fn
+        frame = stack[-1]
+
+        def run(item):
+            self._local.stack = [frame]
+            try:
+                return fn(item)
+            finally:
+                self._local.stack = []
+        return run
+
+    @contextmanager
+    def timed(self, category: str):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(category, time.perf_counter() - started)
+
+    def report(self, top: int = 5) -> str:
+        import io
+        import pstats
+        widths = [28, 6, 10] + [10] * len(self.CATEGORIES) + [10, 12]
+        header = ["阶段", "次数", "总耗时"] + [self.LABELS[c] for c in self.CATEGORIES] + ["本地处理", "内存峰值"]
+        lines = [format_row(header, widths)]
+        for name, st in self._stats.items():
+            local = st["wall"] - sum(st[c] for c in self.CATEGORIES)
+            row = [name, str(int(st["calls"])), f"{st['wall']:.2f}s"]
+            row += [f"{st[c]:.2f}s" for c in self.CATEGORIES]
+            row += [f"{max(local, 0.0):.2f}s", f"{st['mem_peak'] / 1024:.0f}KB"]
+            lines.append(format_row(row, widths))
+        for name, profiles in self._profiles.items():
+            buf = io.StringIO()
+            pstats.Stats(*profiles, stream=buf).sort_stats("cumulative").print_stats(top)
+            body = [ln for ln in buf.getvalue().splitlines() if ln.strip()]
+            lines.append(f"\n--- {name} (cProfile, cumulative top {top}) ---")
+            lines.extend(body[-(top + 1):])
+        return "\n".join(lines)
+
+    def dump(self, path: str) -> bool:
+        """合并所有阶段的 cProfile 结果并保存为 pstats 文件"""
+        import pstats
+        profiles = [p for ps in self._profiles.values() for p in ps]
+        if not profiles:
+            return False
+        pstats.Stats(*profiles).dump_stats(path)
+        return True
+
+
+PROFILER = PhaseProfiler(PROFILE)
+
+
+def sleep(seconds: float) -> None:
+    """time.sleep，性能分析时计入 sleep 耗时"""
+    with PROFILER.timed("sleep"):
+        time.sleep(seconds)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD 自适应并发控制，所有账号的 DSAutomator.request 共用。
+    - 响应健康：每完成约 limit 个请求，并发上限 +1（加性增）
+    - 触发限流（频率类 errmsg、签名服务报错）：上限减半并冷却一段时间（乘性减）
+    - 延迟明显高于基线：视为拥塞前兆，暂停增长；基线缓慢跟随持续的延迟变化
+    """
+    THROTTLE_KEYWORDS = ("频繁", "太快", "限流", "too many", "rate limit")
+
+    def __init__(self, initial: int = 4, max_limit: int = 16, min_limit: int = 1,
+                 backoff: float = 0.5, cooldown: float = 1.0, latency_factor: float = 3.0,
+                 baseline_drift: float = 0.01):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max(min_limit, min(initial, max_limit)))
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.latency_factor = latency_factor
+        self.baseline_drift = baseline_drift
+        self.peak = self.limit
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._in_flight = 0
+        self._latency_total = 0.0
+        self._ewma: Optional[float] = None
+        self._baseline: Optional[float] = None
+        self._cooldown_until = 0.0
+        self._started = time.monotonic()
+        self._cond = threading.Condition()
+
+    @classmethod
+    def is_throttle(cls, errmsg: str) -> bool:
+        errmsg = (errmsg or "").lower()
+        return any(k in errmsg for k in cls.THROTTLE_KEYWORDS)
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= int(self.limit):
+                self._cond.wait(0.5)
+            self._in_flight += 1
+
+    def release(self, latency: float, ok: bool, throttled: bool = False) -> None:
+        now = time.monotonic()
+        with self._cond:
+            self._in_flight -= 1
+            self.requests += 1
+            self._latency_total += latency
+            if not ok:
+                self.errors += 1
+            if throttled:
+                self.throttled += 1
+                # 一个冷却窗口内只减一次，避免同一波限流把上限压到底
+                if now >= self._cooldown_until:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._cooldown_until = now + self.cooldown
+            else:
+                self._ewma = latency if self._ewma is None else 0.8 * self._ewma + 0.2 * latency
+                if self._baseline is None:
+                    self._baseline = self._ewma
+                else:
+                    # 变快时立即跟上，持续变慢时逐渐上移：
+                    # 早期偶然的快速响应不会把基线永久压低，进而一直卡住增长
+                    drift = self._baseline + self.baseline_drift * (self._ewma - self._baseline)
+                    self._baseline = min(self._ewma, drift)
+                congested = self._ewma > self._baseline * self.latency_factor
+                if ok and not congested and now >= self._cooldown_until:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            self.peak = max(self.peak, self.limit)
+            self._cond.notify_all()
+
+    def latency(self) -> float:
+        """近期请求延迟（EWMA，秒），还没有完成的请求时为 0"""
+        with self._cond:
+            return self._ewma or 0.0
+
+    def counters(self) -> Tuple[int, int, int, float]:
+        """请求数、失败数、限流数、总延迟（秒）"""
+        with self._cond:
+            return self.requests, self.errors, self.throttled, self._latency_total
+
+    def absorb(self, counters: Tuple[int, int, int, float]) -> None:
+        """计入其他进程的请求统计"""
+        with self._cond:
+            self.requests += counters[0]
+            self.errors += counters[1]
+            self.throttled += counters[2]
+            self._latency_total += counters[3]
+
+    def summary(self) -> str:
+        """本次运行稳定后的并发上限与吞吐"""
+        elapsed = max(time.monotonic() - self._started, 1e-6)
+        avg_ms = self._latency_total / self.requests * 1000 if self.requests else 0.0
+        return (f"并发上限 {int(self.limit)} (峰值 {int(self.peak)}) | 请求 {self.requests} | "
+                f"失败 {self.errors} | 限流 {self.throttled} | 平均延迟 {avg_ms:.0f}ms | "
+                f"吞吐 {self.requests / elapsed:.1f} req/s")
+
+
+LIMITER = AdaptiveLimiter(max_limit=MAX_CONCURRENCY)
+THROTTLE_RETRIES = 2  # 被限流的请求重试次数（限流时服务端未处理请求）
+# 有副作用的接口被服务端限流时不重试：无法确认服务端是否已经处理（签名失败时请求未发出，仍可重试）
+NON_IDEMPOTENT_ENDPOINTS = frozenset(
+    "/v1/miniapp/act/" + path for path in (
+        "module/interchgCard/receiveMilepost", "module/interchgCard/shareCard",
+        "module/interchgCard/postGiveWish", "module/interchgCard/acceptGiveWish",
+        "task/doMultiActTask", "task/applyTaskPrize", "module/luckDraw/draw",
+    )
+)
+
+
+class ActivityContext:
+    """
+    单个集卡活动（卡册）的元数据，所有账号只读共享。
+    actId 与模块 asId 由第一个参与的账号解析一次，其余账号直接复用。
+    """
+
+    def __init__(self, card_book_id: str, app_key: str = ""):
+        self.card_book_id = card_book_id
+        self.app_key = app_key  # 为空表示未知，使用账号默认角色
+        self.act_id = ""
+        self.card_as_id = ""
+        self.luck_draw_as_id = ""
+        self.task_as_ids: List[str] = []
+        self.inventory = InventoryMatrix()
+        self._resolved = False
+        self._lock = threading.Lock()
+
+    def __repr__(self) -> str:
+        return f"ActivityContext({self.card_book_id!r}, app_key={self.app_key!r})"
+
+    def spec(self) -> Tuple[str, str, str, str, str, List[str]]:
+        """已解析的元数据（可跨进程传递）"""
+        return (self.card_book_id, self.app_key, self.act_id, self.card_as_id,
+                self.luck_draw_as_id, list(self.task_as_ids))
+
+    @classmethod
+    def from_spec(cls, spec: Tuple[str, str, str, str, str, List[str]]) -> "ActivityContext":
+        ctx = cls(spec[0], spec[1])
+        ctx.act_id, ctx.card_as_id, ctx.luck_draw_as_id, ctx.task_as_ids = spec[2], spec[3], spec[4], list(spec[5])
+        ctx._resolved = bool(ctx.act_id)
+        return ctx
+
+    def resolve(self, bot: "DSAutomator") -> bool:
+        """用 bot 的角色获取活动配置与模块ID（每个活动只请求一次）"""
+        with self._lock:
+            if self._resolved:
+                return True
+            config = bot.get_card_book_config()
+            if not config:
+                return False
+            self.act_id = config.get("actId", "")
+            self.card_as_id = config.get("asId", "")
+            for m in bot.get_act_modules():
+                m_id = m.get("asId")
+                if not m_id:
+                    continue
+                try:
+                    m_type_num = int(float(m.get("asType")))
+                except (TypeError, ValueError):
+                    continue
+                # 小程序侧是 find(asType===2)，取第一个；这里也保持一致
+                if m_type_num == AS_TYPE_DRAW and not self.luck_draw_as_id:
+                    self.luck_draw_as_id = m_id
+                elif m_type_num == int(AS_TYPE_CARD) and not self.card_as_id:
+                    self.card_as_id = m_id
+                elif m_type_num == AS_TYPE_TASK and m_id not in self.task_as_ids:
+                    self.task_as_ids.append(m_id)
+            self._resolved = True
+            return True
+
+
+class ActivityRegistry:
+    """本次运行涉及的所有活动；发现流程整个运行只执行一次"""
+
+    def __init__(self):
+        self._items: Dict[str, ActivityContext] = {}
+        self._discovered: List[ActivityContext] = []
+        self._lock = threading.Lock()
+
+    def get(self, card_book_id: str, app_key: str = "") -> ActivityContext:
+        with self._lock:
+            ctx = self._items.get(card_book_id)
+            if ctx is None:
+                ctx = self._items[card_book_id] = ActivityContext(card_book_id, app_key)
+            elif app_key and not ctx.app_key:
+                ctx.app_key = app_key
+            return ctx
+
+    def discover(self, bot: "DSAutomator") -> List[ActivityContext]:
+        """
+        返回本次运行要处理的活动。
+        配置了 NARAKA_CARD_BOOK_ID 时直接使用，否则用 bot 自动发现；
+        发现失败（如该账号 Token 失效）时不缓存结果，可换下一个账号重试。
+        """
+        if self._discovered:
+            return list(self._discovered)
+        if CARD_BOOK_IDS:
+            books = [(book_id, "") for book_id in CARD_BOOK_IDS]
+        else:
+            LOG.info(f"[{bot.name}] 尝试动态获取卡册ID...")
+            books = bot.discover_card_books()
+            for book_id, app_key in books:
+                LOG.info(f"[活动配置] 已自动发现 cardBookId: {book_id}" + (f" ({app_key})" if app_key else ""))
+        contexts = [self.get(book_id, app_key) for book_id, app_key in books]
+        with self._lock:
+            if not self._discovered:
+                self._discovered = contexts
+            return list(self._discovered)
+
+
+    def restore(self, specs: List[Tuple[str, str, str, str, str, List[str]]]) -> List[ActivityContext]:
+        """用父进程解析好的活动元数据代替发现流程（多进程模式的子进程）"""
+        with self._lock:
+            self._discovered = [ActivityContext.from_spec(spec) for spec in specs]
+            self._items = {ctx.card_book_id: ctx for ctx in self._discovered}
+            return list(self._discovered)
+
+
+ACTIVITIES = ActivityRegistry()
+
+
+_NOTIFY_QUEUE: List[Tuple[str, str]] = []
+_NOTIFY_LOCK = threading.Lock()
+
+
 def send_notify(title: str, content: str) -> None:
-    if not notify_send:
+    """加入通知队列，运行结束时由 flush_notify 按标题合并发送"""
+    with _NOTIFY_LOCK:
+        _NOTIFY_QUEUE.append((title, content))
+
+
+def flush_notify() -> None:
+    with _NOTIFY_LOCK:
+        items = list(_NOTIFY_QUEUE)
+        _NOTIFY_QUEUE.clear()
+    if not items:
         return
     try:
-        notify_send(title, content)
-    except Exception as e:
-        print(f"[notify] 发送失败: {e}")
+        from notify import send as notify_send  # 青龙面板通知
+    except Exception:
+        return
+    merged: Dict[str, List[str]] = {}
+    for title, content in items:
+        merged.setdefault(title, []).append(content)
+    for title, contents in merged.items():
+        try:
+            notify_send(title, "\n\n".join(contents))
+        except Exception as e:
+            LOG.warning(f"[notify] 发送失败: {e}")
+
+
+def parse_duration(value: str) -> float:
+    """解析时长：纯数字为秒，支持 s/m/h 后缀；无效或为空返回 0"""
+    value = (value or "").strip().lower()
+    units = {"s": 1, "m": 60, "h": 3600}
+    scale = units.get(value[-1:], 1) if value else 1
+    if value[-1:] in units:
+        value = value[:-1]
+    try:
+        return max(float(value) * scale, 0.0)
+    except ValueError:
+        return 0.0
+
+
+class RunDeadline:
+    """
+    运行时间预算（青龙面板会强制结束超时任务）。
+    - near(): 剩余时间低于余量，或已收到终止信号 —— 不再开始新账号和非必要阶段
+    - expired(): 预算用完或已收到终止信号 —— 已开始的账号在步骤之间停止
+    跳过的工作通过 skip() 记录，结束时输出汇总。
+    """
+
+    def __init__(self, budget: float = 0.0, margin: Optional[float] = None):
+        self.budget = budget
+        self.margin = min(60.0, budget * 0.1) if margin is None else margin
+        self.started = time.monotonic()
+        self.skipped: List[str] = []
+        self.stop_reason = ""
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    def remaining(self) -> float:
+        if self._stopped.is_set():
+            return 0.0
+        if self.budget <= 0:
+            return float("inf")
+        return self.budget - self.elapsed()
+
+    def near(self) -> bool:
+        return self.remaining() <= self.margin
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def stop(self, reason: str) -> None:
+        self.stop_reason = reason
+        self._stopped.set()
+
+    def skip(self, what: str) -> None:
+        with self._lock:
+            self.skipped.append(what)
+
+    def summary(self) -> str:
+        budget = f"{self.budget:.0f}s" if self.budget > 0 else "不限"
+        text = f"已用 {self.elapsed():.0f}s / 预算 {budget}"
+        if self.stop_reason:
+            text += f" | {self.stop_reason}"
+        if self.skipped:
+            text += f" | 跳过 {len(self.skipped)} 项: " + "; ".join(self.skipped)
+        return text
+
+
+DEADLINE = RunDeadline(parse_duration(DEADLINE_BUDGET))
+
+
+_SESSION_LOCK = threading.Lock()
+
+
+def _role_selected(role: Role, selectors: List[str]) -> bool:
+    if "all" in (s.lower() for s in selectors):
+        return True
+    return any(s in (role.role_id, role.nick, role.server, role.server_name) for s in selectors)
 
 
 class DSAutomator:
-    def __init__(self, token: str, uid: str, device_id: str, name: str = ""):
+    def __init__(self, token: str, uid: str, device_id: str, name: str = "",
+                 activity: Optional[ActivityContext] = None):
         self.token = token
         self.uid = uid
         self.device_id = device_id
@@ -67,15 +947,14 @@ class DSAutomator:
         self.app_key = ""
         self.role_id = ""
         self.server = ""
-        self.act_id = ""
-        self.card_as_id = ""
-        self.luck_draw_as_id = ""
+        # --- 活动（多个账号共享，只读）---
+        self.activity = activity
         # --- 缓存 ---
-        self._role_info: Optional[Dict[str, Any]] = None
-        self._act_config: Optional[Dict[str, Any]] = None
+        self._role_list: Optional[List[Role]] = None
+        self._role_info: Optional[Role] = None
         self._initialized: bool = False
-        # --- Session ---
-        self.session = requests.Session()
+        # --- Session（首次请求时创建）---
+        self._session = None
         self.headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36 MicroMessenger/7.0.20.1781(0x6700143B) NetType/WIFI MiniProgramEnv/Windows WindowsWechat/WMPF",
             "Accept": "application/json, text/plain, */*",
@@ -114,12 +993,22 @@ class DSAutomator:
                     "checksum": data.get("checksum")
                 }
             else:
-                print(f"[签名API] 错误: {data.get('error')}")
+                LOG.warning(f"[签名API] 错误: {data.get('error')}")
                 return None
         except Exception as e:
-            print(f"[签名API] 请求失败: {e}")
+            LOG.warning(f"[签名API] 请求失败: {e}")
             return None
 
+    @property
+    def session(self):
+        """requests.Session，首次使用时才导入 requests 并创建"""
+        if self._session is None:
+            with _SESSION_LOCK:
+                if self._session is None:
+                    import requests
+                    self._session = requests.Session()
+        return self._session
+
     def request(self, method: str, endpoint: str, body: Dict[str, Any], silent: bool = False) -> Dict[str, Any]:
         """发起请求，签名通过远程 API 计算
         
@@ -129,22 +1018,46 @@ class DSAutomator:
             body: 请求体
             silent: 是否静默模式（不输出错误日志）
         """
-        url = f"{self.base_url}{endpoint}"
         body_str = json.dumps(body, separators=(',', ':'))
-        
-        # 调用 API 获取签名
-        sign_data = self._get_sign_from_api(body_str)
-        if not sign_data:
-            return {"code": -1, "errmsg": "签名获取失败"}
-        
-        headers = self.headers.copy()
-        headers["GL-Nonce"] = sign_data["nonce"]
-        headers["GL-CheckSum"] = sign_data["checksum"]
-        
-        response = self.session.request(method, url, data=body_str, headers=headers)
-        res_json = response.json()
+        res_json = self._send(method, endpoint, body_str)
         if res_json.get("code") != 200 and not silent:
-            print(f"请求失败 [{endpoint}]: {res_json.get('errmsg', '未知错误')}")
+            LOG.warning(f"请求失败 [{endpoint}]: {res_json.get('errmsg', '未知错误')}")
+        return res_json
+
+    def _send(self, method: str, endpoint: str, body_str: str) -> Dict[str, Any]:
+        """签名并发送请求，受自适应并发控制，被限流时重试（有副作用的接口只在签名失败时重试）"""
+        url = f"{self.base_url}{endpoint}"
+
+        for attempt in range(THROTTLE_RETRIES + 1):
+            if attempt:
+                sleep(LIMITER.cooldown * attempt)
+            with PROFILER.timed("wait"):
+                LIMITER.acquire()
+            started = time.monotonic()
+            res_json: Dict[str, Any] = {"code": -1, "errmsg": "请求异常"}
+            throttled = False
+            try:
+                # 调用 API 获取签名
+                with PROFILER.timed("sign"):
+                    sign_data = self._get_sign_from_api(body_str)
+                if not sign_data:
+                    # 签名服务报错同样按限流处理
+                    res_json = {"code": -1, "errmsg": "签名获取失败"}
+                    throttled = True
+                    continue
+
+                headers = self.headers.copy()
+                headers["GL-Nonce"] = sign_data["nonce"]
+                headers["GL-CheckSum"] = sign_data["checksum"]
+
+                with PROFILER.timed("io"):
+                    response = self.session.request(method, url, data=body_str, headers=headers)
+                res_json = response.json()
+                throttled = res_json.get("code") != 200 and LIMITER.is_throttle(res_json.get("errmsg", ""))
+                if not throttled or endpoint in NON_IDEMPOTENT_ENDPOINTS:
+                    break
+            finally:
+                LIMITER.release(time.monotonic() - started, res_json.get("code") == 200, throttled)
         return res_json
 
     def initialize(self) -> bool:
@@ -158,48 +1071,106 @@ class DSAutomator:
         # 1. 获取角色信息 (appKey, roleId, server 等)
         role = self.get_role_info()
         if not role:
-            print(f"[{self.name}] 初始化失败: 无法获取角色信息")
+            LOG.error(f"[{self.name}] 初始化失败: 无法获取角色信息")
             return False
 
-        # 2. 自动发现卡册ID（如未配置）
-        global CARD_BOOK_ID, _CARD_BOOK_ID_AUTO_LOGGED
-        if not CARD_BOOK_ID:
-            print(f"[{self.name}] 尝试动态获取卡册ID...")
-            discovered = self.discover_latest_card_book_id()
-            if not discovered:
-                print(f"[{self.name}] 初始化失败: 所有方式均无法发现卡册ID，可能当前没有进行中的集卡活动")
-                print(f"[{self.name}] 提示: 可手动设置 NARAKA_CARD_BOOK_ID 或等待新活动开始")
+        # 2. 未指定活动时使用本次运行发现的活动（整个运行只发现一次）
+        if self.activity is None:
+            activities = ACTIVITIES.discover(self)
+            if not activities:
+                LOG.error(f"[{self.name}] 初始化失败: 所有方式均无法发现卡册ID，可能当前没有进行中的集卡活动")
+                LOG.info(f"[{self.name}] 提示: 可手动设置 NARAKA_CARD_BOOK_ID 或等待新活动开始")
                 return False
-            CARD_BOOK_ID = discovered
-            if not _CARD_BOOK_ID_AUTO_LOGGED:
-                print(f"[活动配置] 已自动发现 cardBookId: {CARD_BOOK_ID}")
-                _CARD_BOOK_ID_AUTO_LOGGED = True
-        
-        # 3. 获取活动配置 (actId, card_as_id)
-        config = self.get_card_book_config()
-        if not config:
-            print(f"[{self.name}] 初始化失败: 无法获取活动配置")
+            self.activity = next((a for a in activities if a.app_key in ("", self.app_key)), activities[0])
+            self._role_info = None
+            self.get_role_info()
+
+        # 3. 获取活动配置与模块ID（同一活动只由第一个账号请求）
+        if not self.activity.resolve(self):
+            LOG.error(f"[{self.name}] 初始化失败: 无法获取活动配置")
             return False
         
-        # 4. 动态获取模块 ID (抽奖、卡片等)
-        modules = self.get_act_modules()
-        for m in modules:
-            m_id = m.get("asId")
-            if not m_id:
-                continue
-            try:
-                m_type_num = int(float(m.get("asType")))
-            except (TypeError, ValueError):
-                continue
-            # 小程序侧是 find(asType===2)，取第一个；这里也保持一致
-            if m_type_num == 2 and not self.luck_draw_as_id:
-                self.luck_draw_as_id = m_id
-            elif m_type_num == 43 and not self.card_as_id:
-                self.card_as_id = m_id
-        
         self._initialized = True
         return True
 
+    @property
+    def card_book_id(self) -> str:
+        return self.activity.card_book_id if self.activity else ""
+
+    @property
+    def act_id(self) -> str:
+        return self.activity.act_id if self.activity else ""
+
+    @property
+    def card_as_id(self) -> str:
+        return self.activity.card_as_id if self.activity else ""
+
+    @property
+    def luck_draw_as_id(self) -> str:
+        return self.activity.luck_draw_as_id if self.activity else ""
+
+    def _clone(self) -> "DSAutomator":
+        """浅拷贝实例；先在本实例上创建 Session，所有克隆共用同一个连接池"""
+        self.session
+        return copy.copy(self)
+
+    def for_activity(self, activity: ActivityContext) -> Optional["DSAutomator"]:
+        """
+        返回绑定到指定活动的实例，与当前实例共享 Session 和角色列表。
+        账号没有该活动所属游戏的角色时返回 None。
+        """
+        # 先在本实例上获取角色列表，克隆直接共享，不再各自请求 getBindList
+        role_list = self.get_bind_role_list()
+        if activity.app_key and not any(r.app_key == activity.app_key for r in role_list):
+            return None
+        clone = self._clone()
+        clone.activity = activity
+        clone._role_info = None
+        clone._initialized = False
+        return clone
+
+    def for_role(self, role: Role) -> "DSAutomator":
+        """返回使用指定角色的实例，与当前实例共享 Session、签名、角色列表和活动"""
+        clone = self._clone()
+        clone._update_from_role(role)
+        clone._initialized = False
+        if role.role_id != self.role_id:
+            clone.name = f"{self.name}/{role.nick or role.role_id[:8]}"
+        return clone
+
+    def role_forks(self, activity: ActivityContext) -> List["DSAutomator"]:
+        """
+        参与指定活动的所有角色实例（按 NARAKA_ROLES 选择）。
+        未配置时只有默认角色，与 for_activity 相同。
+        """
+        base = self.for_activity(activity)
+        if base is None or not ROLES or not base.get_role_info():
+            return [base] if base else []
+        roles = [
+            r for r in base.get_bind_role_list()
+            if r.app_key == base.app_key and _role_selected(r, ROLES)
+        ]
+        if not roles:
+            return [base]
+        return [base if r.role_id == base.role_id else base.for_role(r) for r in roles]
+
+    def discover_card_books(self) -> List[Tuple[str, str]]:
+        """
+        发现所有进行中的卡册，返回 [(cardBookId, appKey)]。
+        先按账号绑定的每个游戏查询卡册列表，都没有时回退到单卡册的多重发现流程。
+        """
+        app_keys = sorted({r.app_key for r in self.get_bind_role_list() if r.app_key},
+                          key=lambda k: (k != "d90", k))
+        books: List[Tuple[str, str]] = []
+        for app_key in app_keys:
+            for book in self._fetch_card_books(app_key):
+                if book.active and book.id not in {b for b, _ in books}:
+                    books.append((book.id, book.app_key or app_key))
+        if books:
+            return books
+        book_id = self.discover_latest_card_book_id()
+        return [(book_id, "")] if book_id else []
+
     def discover_latest_card_book_id(self) -> str:
         """
         自动获取最新卡册ID。
@@ -208,37 +1179,37 @@ class DSAutomator:
         # 方式1【主要】：通过 cardBookInfos 获取当前游戏的卡册
         book_id = self._discover_from_card_book_infos(self.app_key or "d90")
         if book_id:
-            print(f"[{self.name}] 从卡册列表(d90)找到卡册ID: {book_id[:16]}...")
+            LOG.info(f"[{self.name}] 从卡册列表(d90)找到卡册ID: {book_id[:16]}...")
             return book_id
 
         # 方式2：不限游戏，获取所有游戏的卡册
         book_id = self._discover_from_card_book_infos(None)
         if book_id:
-            print(f"[{self.name}] 从卡册列表(全部游戏)找到卡册ID: {book_id[:16]}...")
+            LOG.info(f"[{self.name}] 从卡册列表(全部游戏)找到卡册ID: {book_id[:16]}...")
             return book_id
 
         # 方式3：通过 cardBookGameList 获取有卡册的游戏，再逐个查询
         book_id = self._discover_from_game_list()
         if book_id:
-            print(f"[{self.name}] 从卡册游戏列表找到卡册ID: {book_id[:16]}...")
+            LOG.info(f"[{self.name}] 从卡册游戏列表找到卡册ID: {book_id[:16]}...")
             return book_id
 
         # 方式4：通过静态配置获取
         book_id = self._discover_from_static_config()
         if book_id:
-            print(f"[{self.name}] 从静态配置找到卡册ID: {book_id[:16]}...")
+            LOG.info(f"[{self.name}] 从静态配置找到卡册ID: {book_id[:16]}...")
             return book_id
 
         # 方式5：通过福利中心游戏信息获取
         book_id = self._discover_from_welfare_info()
         if book_id:
-            print(f"[{self.name}] 从福利中心找到卡册ID: {book_id[:16]}...")
+            LOG.info(f"[{self.name}] 从福利中心找到卡册ID: {book_id[:16]}...")
             return book_id
 
         return ""
 
-    def _discover_from_card_book_infos(self, app_key: Optional[str]) -> str:
-        """通过 cardBookInfos 接口获取卡册ID"""
+    def _fetch_card_books(self, app_key: Optional[str]) -> List[CardBook]:
+        """通过 cardBookInfos 接口获取卡册列表"""
         body: Dict[str, Any] = {
             "pageNum": 0,
             "pageSize": 10
@@ -247,21 +1218,18 @@ class DSAutomator:
             body["appKey"] = app_key
         res = self.request("POST", "/v1/miniapp/act/module/interchgCard/cardBookInfos", body, silent=True)
         result = res.get("result") or {}
-        books = result.get("books") or []
-        # 优先找进行中的卡册
         now_ms = int(time.time() * 1000)
+        return [CardBook.from_raw(book or {}, app_key or "", now_ms) for book in result.get("books") or []]
+
+    def _discover_from_card_book_infos(self, app_key: Optional[str]) -> str:
+        """通过 cardBookInfos 接口获取卡册ID"""
+        books = self._fetch_card_books(app_key)
+        # 优先找进行中的卡册
         for book in books:
-            base_info = book.get("baseInfo") or {}
-            end_time = base_info.get("endTime") or 0
-            book_id = (base_info.get("id") or book.get("id") or "").strip()
-            if book_id and (not end_time or end_time > now_ms):
-                return book_id
+            if book.active:
+                return book.id
         # 没有进行中的，取第一个
-        if books:
-            book0 = books[0] or {}
-            base_info = book0.get("baseInfo") or {}
-            return (base_info.get("id") or book0.get("id") or "").strip()
-        return ""
+        return books[0].id if books else ""
 
     def _discover_from_game_list(self) -> str:
         """通过 cardBookGameList 获取有卡册活动的游戏，再查询各游戏的卡册"""
@@ -359,83 +1327,82 @@ class DSAutomator:
         """
         从 cardBookDetail 获取活动配置（actId, card_as_id）。
         """
-        if self._act_config:
-            return self._act_config
-        
         body = {
-            "cardBookId": CARD_BOOK_ID,
+            "cardBookId": self.card_book_id,
             "appKey": self.app_key,
             "roleId": self.role_id,
             "server": self.server
         }
         res = self.request("POST", "/v1/miniapp/act/module/interchgCard/cardBookDetail", body)
-        result = res.get("result")
-        if not result:
-            return None
-        
-        self.act_id = result.get("actId", "")
-        self.card_as_id = result.get("asId", "")
-        
-        self._act_config = result
-        return result
+        return res.get("result") or None
 
-    def get_bind_role_list(self) -> List[Dict[str, Any]]:
+    def get_bind_role_list(self, force_refresh: bool = False) -> List[Role]:
         """
         获取绑定的角色列表（动态获取角色信息）。
         返回所有绑定到当前账号的游戏角色。
         """
+        if self._role_list and not force_refresh:
+            return self._role_list
+
         body = {}
         res = self.request("POST", "/v1/miniapp/game/role/getBindList", body)
         result = res.get("result")
         
-        if result is None:
-            return []
-        
+        raw_list: List[Dict[str, Any]] = []
         # 如果 result 直接是列表
         if isinstance(result, list):
-            return result
-        
+            raw_list = result
         # 如果是字典，尝试不同的 key
-        if isinstance(result, dict):
-            return (
+        elif isinstance(result, dict):
+            raw_list = (
                 result.get("appRoleList") or 
                 result.get("roleList") or 
                 result.get("list") or 
                 []
             )
-        
-        return []
+        role_list = [Role.from_raw(r) for r in raw_list if r]
+        self._role_list = role_list
+        return role_list
 
-    def get_role_info(self, force_refresh: bool = False) -> Optional[Dict[str, Any]]:
+    def get_role_info(self, force_refresh: bool = False) -> Optional[Role]:
         """
         获取当前角色详细信息。
         """
         if self._role_info and not force_refresh:
             return self._role_info
         
-        role_list = self.get_bind_role_list()
+        role_list = self.get_bind_role_list(force_refresh)
         
         if not role_list:
-            print(f"[{self.name}] 警告: 无法获取角色列表")
+            LOG.warning(f"[{self.name}] 警告: 无法获取角色列表")
             return None
         
-        # 优先查找 d90 (永劫无间) 的角色
-        d90_role = next((r for r in role_list if r.get("appKey") == "d90"), None)
-        if d90_role:
-            self._update_from_role(d90_role)
-            return d90_role
+        # 优先查找活动所属游戏的角色，未知时优先 d90 (永劫无间)
+        want_app_key = (self.activity.app_key if self.activity else "") or "d90"
+        matched_role = next((r for r in role_list if r.app_key == want_app_key), None)
+        if matched_role:
+            self._update_from_role(matched_role)
+            return matched_role
         
-        # 没有 d90 角色，使用第一个
+        # 没有对应角色，使用第一个
         self._update_from_role(role_list[0])
         return self._role_info
 
-    def _update_from_role(self, role: Dict[str, Any]):
+    def _update_from_role(self, role: Role):
         """从角色信息更新实例属性"""
-        self.role_id = role.get("roleId") or role.get("role_id") or self.role_id
-        self.server = role.get("server") or self.server
-        self.app_key = role.get("appKey") or role.get("app_key") or self.app_key or "d90"
+        self.role_id = role.role_id or self.role_id
+        self.server = role.server or self.server
+        self.app_key = role.app_key or self.app_key or "d90"
         self._role_info = role
 
+    @property
+    def nick(self) -> str:
+        """日志显示名称：优先使用游戏角色名"""
+        role = self._role_info
+        if not role:
+            return self.name
+        return role.nick or self.name
+
     def _build_act_role_info(self) -> Dict[str, Any]:
         """
         构建活动请求中的 actRoleInfo 参数（动态获取）。
@@ -450,11 +1417,11 @@ class DSAutomator:
             }
         
         return {
-            "roleLevel": role.get("roleLevel") or role.get("level") or 0,
-            "serverName": role.get("serverName") or role.get("server_name") or "",
-            "nick": role.get("nick") or role.get("roleName") or "",
-            "icon": role.get("icon") or "",
-            "lastModified": role.get("lastModified") or int(time.time() * 1000),
+            "roleLevel": role.level,
+            "serverName": role.server_name,
+            "nick": role.nick,
+            "icon": role.icon,
+            "lastModified": role.last_modified or int(time.time() * 1000),
             "appKey": self.app_key,
             "roleId": self.role_id,
             "server": self.server
@@ -472,23 +1439,11 @@ class DSAutomator:
         res = self.request("POST", "/v1/miniapp/act/module/common/actInfo", body)
         return res.get("result", {}).get("moduleList", [])
 
-    def get_tasks(self):
-        # 1. 动态获取所有模块并筛选任务模块 (asType=4)
-        modules = self.get_act_modules()
-        task_as_ids: List[str] = []
-        for m in modules:
-            as_id = m.get("asId")
-            if not as_id:
-                continue
-            try:
-                as_type_num = int(float(m.get("asType")))
-            except (TypeError, ValueError):
-                continue
-            if as_type_num == 4:
-                task_as_ids.append(as_id)
-        
+    def get_tasks(self) -> List[Task]:
+        # 1. 任务模块 (asType=4) 已在活动解析时缓存
+        task_as_ids = self.activity.task_as_ids if self.activity else []
         if not task_as_ids:
-            print(f"[{self.name}] 未在当前活动中找到任务模块")
+            LOG.info(f"[{self.name}] 未在当前活动中找到任务模块")
             return []
 
         # 2. 动态获取角色信息
@@ -511,7 +1466,7 @@ class DSAutomator:
             "visiblePrdType": "MINI_PROGRAM"
         }
 
-        all_tasks: List[Dict[str, Any]] = []
+        all_tasks: List[Task] = []
         seen_task_ids: set = set()
         for as_id in task_as_ids:
             body = base_body.copy()
@@ -519,12 +1474,12 @@ class DSAutomator:
             res = self.request("POST", "/v1/miniapp/act/task/taskInfo", body)
             task_list = (res.get("result") or {}).get("taskList") or []
             for t in task_list:
-                task_id = t.get("asId") or t.get("id")
-                if task_id and task_id in seen_task_ids:
+                task = Task.from_raw(t or {})
+                if task.as_id and task.as_id in seen_task_ids:
                     continue
-                if task_id:
-                    seen_task_ids.add(task_id)
-                all_tasks.append(t)
+                if task.as_id:
+                    seen_task_ids.add(task.as_id)
+                all_tasks.append(task)
 
         return all_tasks
 
@@ -554,7 +1509,7 @@ class DSAutomator:
         }
         return self.request("POST", "/v1/miniapp/act/module/interchgCard/collectInfo", body)
 
-    def get_my_cards(self, card_as_id=None):
+    def get_my_cards(self, card_as_id=None) -> CardSnapshot:
         card_as_id = card_as_id or self.card_as_id
         body = {
             "actId": self.act_id,
@@ -565,7 +1520,7 @@ class DSAutomator:
             "server": self.server
         }
         res = self.request("POST", "/v1/miniapp/act/module/interchgCard/myCard", body)
-        return res.get("result", {})
+        return CardSnapshot.from_raw(res.get("result") or {})
 
     def receive_milepost(self, node_id: str, card_as_id=None) -> Dict[str, Any]:
         """
@@ -589,44 +1544,49 @@ class DSAutomator:
         res = self.request("POST", "/v1/miniapp/act/module/interchgCard/receiveMilepost", body, silent=True)
         return res
 
-    def claim_all_milepost_rewards(self) -> List[str]:
+    def _state_key(self) -> str:
+        """本地状态缓存中的账号标识"""
+        return f"{self.uid}:{self.role_id}"
+
+    def state_record(self) -> Dict[str, Any]:
+        """本账号（角色）在当前活动下的本地缓存"""
+        return STATE.account(self._state_key(), self.card_book_id)
+
+    def claim_all_milepost_rewards(self, card_data: Optional[CardSnapshot] = None) -> List[str]:
         """
         领取所有可领取的里程碑奖励。
-        
+        是否可领取以 myCard 快照中的节点状态为准（接口不返回节点所需的卡片数，无法在本地预测）；
+        完整流程复用「卡片状态」步骤已获取的快照，可领取的节点并发领取。
+
+        Args:
+            card_data: myCard 快照；不传则重新获取
+            
         Returns:
             领取到的奖品名称列表
         """
-        card_data = self.get_my_cards()
-        milepost_infos = card_data.get('milepostInfos', [])
+        if card_data is None:
+            card_data = self.get_my_cards()
+        # 状态说明：
+        # - RECEIVE = 已领取
+        # - UN_RECEIVE = 可领取（达到条件但未领取）
+        # - UN_COMPLETE = 未达成条件
+        eligible = [m for m in card_data.mileposts if m.state == 'UN_RECEIVE' and m.node_id]
+
         prizes_claimed = []
-        
-        for milepost in milepost_infos:
-            state = milepost.get('state', '')
-            node_id = milepost.get('nodeId', '')
-            title = milepost.get('title', '')
-            
-            # 状态说明：
-            # - RECEIVE = 已领取
-            # - UN_RECEIVE = 可领取（达到条件但未领取）
-            # - UN_COMPLETE = 未达成条件
-            if state != 'UN_RECEIVE' or not node_id:
-                continue
-            
-            res = self.receive_milepost(node_id)
+        results = run_concurrently(lambda m: self.receive_milepost(m.node_id), eligible)
+        for m, res in zip(eligible, results):
             if res.get('code') == 200:
-                print(f"  领取里程碑奖励: {title}")
+                LOG.info(f"  领取里程碑奖励: {m.title}")
                 win_prizes = res.get('result', {}).get('winPrizeList', [])
                 for prize in win_prizes:
                     prize_name = prize.get('prizeName', '未知奖品')
                     prizes_claimed.append(prize_name)
-                    print(f"    -> 获得: {prize_name}")
+                    LOG.info(f"    -> 获得: {prize_name}")
             else:
                 # 如果是"已领取"错误，静默跳过；其他错误才输出
                 errmsg = res.get('errmsg', '')
                 if '已经领取' not in errmsg and '已领取' not in errmsg:
-                    print(f"  [{title}] 领取失败: {errmsg}")
-            time.sleep(0.3)
-        
+                    LOG.warning(f"  [{m.title}] 领取失败: {errmsg}")
         return prizes_claimed
 
     def share_card(self):
@@ -675,39 +1635,17 @@ class DSAutomator:
         res = self.request("POST", "/v1/miniapp/act/module/interchgCard/acceptGiveWish", body)
         return res
 
-    def get_giftable_cards(self) -> List[Dict[str, Any]]:
+    def get_giftable_cards(self) -> List[Card]:
         """
         获取可赠送的卡片（数量 > 1 的卡片，保留1张自用）。
         """
-        card_data = self.get_my_cards()
-        card_infos = card_data.get('cardInfos', [])
-        giftable = []
-        for c in card_infos:
-            num = c.get('num', 0) or 0
-            if num > 1:  # 多于1张才能送
-                giftable.append({
-                    "id": c.get("id"),
-                    "name": c.get("name"),
-                    "num": num,
-                    "can_give": num - 1  # 可赠送数量
-                })
-        return giftable
-
-    def get_missing_cards(self) -> List[Dict[str, Any]]:
+        return self.get_my_cards().giftable()
+
+    def get_missing_cards(self) -> List[Card]:
         """
         获取缺少的卡片（数量 = 0 的卡片）。
         """
-        card_data = self.get_my_cards()
-        card_infos = card_data.get('cardInfos', [])
-        missing = []
-        for c in card_infos:
-            num = c.get('num', 0) or 0
-            if num == 0:
-                missing.append({
-                    "id": c.get("id"),
-                    "name": c.get("name")
-                })
-        return missing
+        return self.get_my_cards().missing()
 
     def do_task(self, task_as_id):
         body = {
@@ -748,6 +1686,297 @@ class DSAutomator:
         return res.get("result", {})
 
 
+class GiftTransfer(NamedTuple):
+    """一次计划中的卡片赠送"""
+    sender: DSAutomator
+    receiver: DSAutomator
+    card_id: str
+    card_name: str
+    reason: str = ""
+
+
+class GiftResult(NamedTuple):
+    """赠送结果；wish_id 非空但 ok=False 表示已发起但对方未领取成功"""
+    transfer: GiftTransfer
+    ok: bool
+    wish_id: str = ""
+    error: str = ""
+
+
+class GiftExecutor:
+    """
+    批量执行卡片赠送。
+    1. 并发发起所有 postGiveWish
+    2. 按 wishId 批量并发 acceptGiveWish，失败的领取按间隔重试
+    已发起但仍未领取的赠送保留在 pending 中，便于重试或汇报。
+    """
+
+    def __init__(self, max_workers: int = 8, accept_retries: int = 2, retry_delay: float = 0.5):
+        self.max_workers = max_workers
+        self.accept_retries = accept_retries
+        self.retry_delay = retry_delay
+        self.pending: Dict[str, GiftTransfer] = {}  # wishId -> 赠送
+        self._errors: Dict[str, str] = {}  # wishId -> 最近一次领取错误
+
+    def post_all(self, transfers: List[GiftTransfer]) -> List[GiftResult]:
+        """并发发起赠送，返回发起失败的结果；成功的进入 pending"""
+        results = run_concurrently(lambda t: t.sender.post_give_wish(t.card_id), transfers, self.max_workers)
+        failed: List[GiftResult] = []
+        for t, res in zip(transfers, results):
+            wish_id = (res.get('result') or {}).get('interchangeWishId') if res.get('code') == 200 else None
+            if wish_id:
+                LOG.info(f"[{t.sender.nick}] -> [{t.receiver.nick}] {t.reason}: {t.card_name} (wishId: {wish_id[:16]}...)")
+                self.pending[wish_id] = t
+            else:
+                LOG.warning(f"[{t.sender.nick}] -> [{t.receiver.nick}] {t.reason}: {t.card_name} 赠送发起失败: {res.get('errmsg')}")
+                failed.append(GiftResult(t, False, error=res.get('errmsg') or ""))
+        return failed
+
+    def accept_pending(self, retries: Optional[int] = None) -> List[GiftResult]:
+        """批量领取 pending 中的赠送，返回成功领取的结果"""
+        retries = self.accept_retries if retries is None else retries
+        accepted: List[GiftResult] = []
+        for attempt in range(retries + 1):
+            items = list(self.pending.items())
+            if not items:
+                break
+            if attempt:
+                sleep(self.retry_delay)
+            results = run_concurrently(lambda kv: kv[1].receiver.accept_give_wish(kv[0]), items, self.max_workers)
+            for (wish_id, t), res in zip(items, results):
+                if res.get('code') == 200:
+                    del self.pending[wish_id]
+                    self._errors.pop(wish_id, None)
+                    LOG.info(f"  [{t.receiver.nick}] 领取成功: {t.card_name}")
+                    accepted.append(GiftResult(t, True, wish_id))
+                else:
+                    self._errors[wish_id] = res.get('errmsg') or ""
+        return accepted
+
+    def unaccepted(self) -> List[GiftResult]:
+        """已发起但未领取成功的赠送"""
+        return [GiftResult(t, False, wish_id, self._errors.get(wish_id, ""))
+                for wish_id, t in self.pending.items()]
+
+    def execute(self, transfers: List[GiftTransfer]) -> List[GiftResult]:
+        """发起并领取一批赠送，结果与 transfers 一一对应"""
+        by_transfer: Dict[int, GiftResult] = {}
+        for r in self.post_all(transfers):
+            by_transfer[id(r.transfer)] = r
+        for r in self.accept_pending():
+            by_transfer[id(r.transfer)] = r
+        for r in self.unaccepted():
+            LOG.warning(f"  [{r.transfer.receiver.nick}] 领取失败: {r.error} (wishId: {r.wish_id[:16]}...)")
+            by_transfer[id(r.transfer)] = r
+        return [by_transfer[id(t)] for t in transfers]
+
+
+def plan_gift(sender: DSAutomator, receiver: DSAutomator,
+              giftable: List[Card], receiver_missing: List[Card],
+              exclude: Optional[set] = None) -> Optional[GiftTransfer]:
+    """
+    规划一个方向的赠送：
+    1. 优先送对方缺少的卡
+    2. 对方不缺卡时送数量最多的卡（为完成任务获取抽奖机会）
+    exclude 中的卡片ID不参与规划（用于发起失败后的回退）。
+    """
+    exclude = exclude or set()
+    candidates = [c for c in giftable if c.id not in exclude]
+    missing_ids = {c.id for c in receiver_missing}
+    for card in candidates:
+        if card.id in missing_ids:
+            return GiftTransfer(sender, receiver, card.id, card.name, "赠送缺少的卡")
+    if candidates:
+        card = max(candidates, key=lambda x: x.num)
+        return GiftTransfer(sender, receiver, card.id, card.name, "赠送数量最多的卡(完成任务)")
+    return None
+
+
+_NUMPY: Any = False  # False=尚未尝试导入
+
+
+def _numpy():
+    """按需导入 NumPy（可选依赖：库存矩阵向量化统计），未安装时返回 None"""
+    global _NUMPY
+    if _NUMPY is False:
+        try:
+            import numpy
+            _NUMPY = numpy
+        except ImportError:
+            _NUMPY = None
+    return _NUMPY
+
+
+class InventoryMatrix:
+    """
+    账号 × 卡片 的库存矩阵。
+    数据按行存于扁平的 array('i')；安装了 NumPy 时以零拷贝视图做向量化统计。
+    """
+
+    def __init__(self):
+        self.accounts: List[str] = []
+        self.card_ids: List[str] = []
+        self.card_names: Dict[str, str] = {}
+        self._rows: Dict[str, int] = {}
+        self._cols: Dict[str, int] = {}
+        self._data = array('i')
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def _widen(self, new_ids: List[str]) -> None:
+        """新增卡片列（同一活动内很少发生，整体重排一次）"""
+        old_width = len(self.card_ids)
+        width = old_width + len(new_ids)
+        data = array('i', bytes(len(self.accounts) * width * self._data.itemsize))
+        for r in range(len(self.accounts)):
+            data[r * width:r * width + old_width] = self._data[r * old_width:(r + 1) * old_width]
+        for card_id in new_ids:
+            self._cols[card_id] = len(self.card_ids)
+            self.card_ids.append(card_id)
+        self._data = data
+
+    def add(self, account: str, cards: Tuple[Card, ...]) -> None:
+        """写入（或覆盖）一个账号的 myCard 库存"""
+        with self._lock:
+            new_ids = []
+            for c in cards:
+                if c.id and c.id not in self._cols and c.id not in new_ids:
+                    new_ids.append(c.id)
+                if c.id:
+                    self.card_names[c.id] = c.name
+            if new_ids:
+                self._widen(new_ids)
+            width = len(self.card_ids)
+            row = self._rows.get(account)
+            if row is None:
+                row = self._rows[account] = len(self.accounts)
+                self.accounts.append(account)
+                self._data.extend([0] * width)
+            base = row * width
+            for c in cards:
+                if c.id:
+                    self._data[base + self._cols[c.id]] = c.num
+
+    def _matrix(self):
+        """NumPy 视图 (账号数, 卡片数)；未安装 NumPy 时返回 None"""
+        np = _numpy()
+        if np is None:
+            return None
+        return np.frombuffer(self._data, dtype=np.int32).reshape(len(self.accounts), len(self.card_ids))
+
+    def rows(self) -> List[Tuple[str, Tuple[Card, ...]]]:
+        """逐账号导出库存（可跨进程传递，另一侧用 add() 写回）"""
+        with self._lock:
+            return [
+                (account, tuple(Card(card_id, self.card_names.get(card_id, card_id), n)
+                                for card_id, n in zip(self.card_ids, row)))
+                for account, row in zip(self.accounts, self._iter_rows())
+            ]
+
+    def _iter_rows(self):
+        width = len(self.card_ids)
+        for r in range(len(self.accounts)):
+            yield self._data[r * width:(r + 1) * width]
+
+    def card_stats(self) -> List[Dict[str, Any]]:
+        """
+        按卡片统计全体账号：
+        total=总数, owners=拥有的账号数, surplus=可赠送的多余张数, deficit=缺少此卡的账号数
+        """
+        with self._lock:
+            return self._card_stats()
+
+    def _card_stats(self) -> List[Dict[str, Any]]:
+        m = self._matrix()
+        if m is not None:
+            total = m.sum(axis=0).tolist()
+            owners = (m > 0).sum(axis=0).tolist()
+            surplus = (m - 1).clip(0, None).sum(axis=0).tolist()
+        else:
+            width = len(self.card_ids)
+            total, owners, surplus = [0] * width, [0] * width, [0] * width
+            for row in self._iter_rows():
+                for j, n in enumerate(row):
+                    total[j] += n
+                    if n > 0:
+                        owners[j] += 1
+                        surplus[j] += n - 1
+        return [
+            {"id": card_id, "name": self.card_names.get(card_id, card_id), "total": total[j],
+             "owners": owners[j], "surplus": surplus[j], "deficit": len(self.accounts) - owners[j]}
+            for j, card_id in enumerate(self.card_ids)
+        ]
+
+    def account_stats(self) -> List[Dict[str, Any]]:
+        """按账号统计：owned=已拥有种类数, missing=缺少种类数, duplicates=重复张数"""
+        with self._lock:
+            return self._account_stats()
+
+    def _account_stats(self) -> List[Dict[str, Any]]:
+        m = self._matrix()
+        if m is not None:
+            owned = (m > 0).sum(axis=1).tolist()
+            duplicates = (m - 1).clip(0, None).sum(axis=1).tolist()
+        else:
+            owned, duplicates = [], []
+            for row in self._iter_rows():
+                owned.append(sum(1 for n in row if n > 0))
+                duplicates.append(sum(n - 1 for n in row if n > 1))
+        width = len(self.card_ids)
+        return [
+            {"account": name, "owned": owned[i], "missing": width - owned[i], "duplicates": duplicates[i]}
+            for i, name in enumerate(self.accounts)
+        ]
+
+    def closest_to_completion(self, limit: int = 5) -> List[Dict[str, Any]]:
+        """尚未集齐的账号中，缺卡最少的若干个"""
+        incomplete = [a for a in self.account_stats() if a["missing"] > 0]
+        incomplete.sort(key=lambda a: (a["missing"], -a["duplicates"]))
+        return incomplete[:limit]
+
+    def to_csv(self, path: str) -> None:
+        import csv
+        with open(path, "w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["account"] + [self.card_names.get(c, c) for c in self.card_ids])
+            for name, row in zip(self.accounts, self._iter_rows()):
+                writer.writerow([name] + list(row))
+
+    def to_json(self, path: str) -> None:
+        payload = {
+            "cards": [{"id": c, "name": self.card_names.get(c, c)} for c in self.card_ids],
+            "accounts": self.accounts,
+            "matrix": [list(row) for row in self._iter_rows()],
+            "card_stats": self.card_stats(),
+            "account_stats": self.account_stats(),
+        }
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2)
+
+    def export(self, path: str) -> None:
+        """按扩展名导出 CSV 或 JSON"""
+        if path.lower().endswith(".csv"):
+            self.to_csv(path)
+        else:
+            self.to_json(path)
+
+
+def print_inventory_report(matrix: InventoryMatrix) -> None:
+    """打印全体账号的集卡统计"""
+    if not len(matrix):
+        return
+    LOG.info(f"\n{'#'*60}")
+    LOG.info(f"# 集卡统计 ({len(matrix)} 个账号)")
+    LOG.info(f"{'#'*60}")
+    for c in sorted(matrix.card_stats(), key=lambda c: (-c["deficit"], c["surplus"])):
+        LOG.info(f"{c['name']}: 缺少 {c['deficit']} 个账号 | 可赠送 {c['surplus']} 张 | 总数 {c['total']}")
+    closest = matrix.closest_to_completion()
+    if closest:
+        LOG.info("最接近集齐: " + ", ".join(f"{a['account']}(缺{a['missing']})" for a in closest))
+
+
 def parse_accounts_from_env() -> List[Tuple[str, str, str, str]]:
     env_value = os.environ.get("NARAKA_TOKEN", "").strip()
     if not env_value:
@@ -767,7 +1996,7 @@ def parse_accounts_from_env() -> List[Tuple[str, str, str, str]]:
         parts = line.split(sep)
         
         if len(parts) < 3:
-            print(f"[警告] 第{idx}行账号格式错误，至少需要 TOKEN{sep}UID{sep}DEVICE_ID")
+            LOG.warning(f"[警告] 第{idx}行账号格式错误，至少需要 TOKEN{sep}UID{sep}DEVICE_ID")
             continue
         
         token = parts[0].strip()
@@ -780,283 +2009,885 @@ def parse_accounts_from_env() -> List[Tuple[str, str, str, str]]:
     return accounts
 
 
-if __name__ == "__main__":
-    ACCOUNTS = parse_accounts_from_env()
-    
-    if not ACCOUNTS:
-        print("[error] 未配置账号信息，请设置环境变量 NARAKA_TOKEN")
-        print("[info] 格式: TOKEN#UID#DEVICE_ID#名称，多个账号用 & 分隔")
-        exit(1)
-        
-    print(f"[青龙面板] 从环境变量 NARAKA_TOKEN 读取到 {len(ACCOUNTS)} 个账号")
-    
-    # 检查签名 API 是否配置
-    if SIGN_API_URL == "https://your-worker.workers.dev/api/sign":
-        print("[error] 未配置签名 API 地址，请设置环境变量 NARAKA_SIGN_API_URL")
-        print("[info] 示例: export NARAKA_SIGN_API_URL='https://xxx.workers.dev/api/sign'")
-        exit(1)
-    
-    print(f"[签名API] {SIGN_API_URL}")
+# =============================================================================
+# 执行流程
+# =============================================================================
 
-    # 卡册ID：可选（未配置将自动发现）
-    if CARD_BOOK_ID:
-        print(f"[活动配置] cardBookId: {CARD_BOOK_ID}")
-    # =============================================================================
 
-    def create_bot(account_tuple) -> DSAutomator:
-        """根据账号元组创建 DSAutomator 实例"""
-        token, uid, device_id, name = account_tuple
-        return DSAutomator(token, uid, device_id, name)
+def create_bot(account_tuple: Tuple[str, str, str, str]) -> DSAutomator:
+    """根据账号元组创建 DSAutomator 实例"""
+    token, uid, device_id, name = account_tuple
+    return DSAutomator(token, uid, device_id, name)
+
+
+def filter_accounts(accounts: List[Tuple[str, str, str, str]],
+                    selectors: List[str]) -> List[Tuple[str, str, str, str]]:
+    """按名称、UID 或序号（从 1 开始）筛选账号；selectors 为空时返回全部"""
+    wanted = {x.strip() for sel in selectors for x in sel.split(",") if x.strip()}
+    if not wanted:
+        return accounts
+    return [
+        acc for idx, acc in enumerate(accounts, 1)
+        if acc[3] in wanted or acc[1] in wanted or str(idx) in wanted
+    ]
+
+
+def activity_bots(accounts: List[DSAutomator], activity: ActivityContext) -> List[DSAutomator]:
+    """参与活动的所有账号（角色）实例；单个账号获取角色列表出错时跳过该账号"""
+    bots: List[DSAutomator] = []
+    for account in accounts:
+        try:
+            bots.extend(account.role_forks(activity))
+        except Exception as e:
+            LOG.error(f"[{account.name}] 获取角色列表出错，跳过此账号: {e}")
+    return bots
 
-    def run_daily_tasks(bot: DSAutomator):
-        """执行单个账号的每日任务"""
-        # 初始化（动态获取所有参数）
-        if not bot.initialize():
-            print(f"[{bot.name}] 初始化失败，跳过此账号")
+
+def first_ready(accounts: List[DSAutomator], activity: ActivityContext) -> Optional[DSAutomator]:
+    """第一个能为活动完成初始化的账号实例（同时解析活动配置），出错的账号跳过"""
+    for account in accounts:
+        try:
+            bot = account.for_activity(activity)
+            if bot and bot.initialize():
+                return bot
+        except Exception as e:
+            LOG.error(f"[{account.name}] 初始化出错: {e}")
+    return None
+
+
+def for_each_account(bots: List[DSAutomator], fn: Callable[[DSAutomator], Any], workers: int = 0) -> None:
+    """对每个账号执行 fn（按 NARAKA_WORKERS 并发），单个账号出错不影响其他账号"""
+    def run(bot: DSAutomator):
+        if DEADLINE.near():
+            DEADLINE.skip(f"{bot.name}: 未开始")
             return
+        with LOG.block(bot.name):
+            try:
+                fn(bot)
+            except Exception as e:
+                LOG.error(f"[{bot.name}] 执行任务出错: {e}")
 
-        # 获取角色信息，用角色名作为显示名称
-        role_info = bot.get_role_info()
-        nick = "未知"
-        if role_info:
-            nick = role_info.get("nick") or role_info.get("roleName") or bot.name
-            level = role_info.get("roleLevel") or role_info.get("level") or 0
-            server_name = role_info.get("serverName") or role_info.get("server_name") or "未知"
-        
-        print(f"\n{'='*60}")
-        print(f"[{nick}] 开始执行每日任务")
-        print(f"{'='*60}")
-        
-        if role_info:
-            print(f"角色: {nick} | 等级: Lv.{level} | 服务器: {server_name}")
-            print(f"动态参数: appKey={bot.app_key}, roleId={bot.role_id[:16]}..., actId={bot.act_id[:16]}...")
-        else:
-            print("警告: 无法获取角色信息，将使用默认配置")
+    # 同一账号的多个角色（NARAKA_ROLES）共享 Session，一起并发处理，只占一个并发名额
+    groups: Dict[str, List[DSAutomator]] = {}
+    for bot in bots:
+        groups.setdefault(bot.uid, []).append(bot)
+    run_concurrently(lambda group: run_concurrently(run, group, len(group)), list(groups.values()),
+                     workers or WORKERS)
+
+
+def initialize_bot(bot: DSAutomator) -> bool:
+    """初始化（动态获取所有参数）"""
+    with PROFILER.phase("initialize"):
+        initialized = bot.initialize()
+    if not initialized:
+        LOG.error(f"[{bot.name}] 初始化失败，跳过此账号")
+    return initialized
+
+
+def print_account_header(bot: DSAutomator) -> None:
+    """打印账号与角色信息"""
+    role_info = bot.get_role_info()
+    nick = bot.nick
+    LOG.info(f"\n{'='*60}")
+    LOG.info(f"[{nick}] 开始执行每日任务")
+    LOG.info(f"{'='*60}")
+
+    if role_info:
+        LOG.info(f"角色: {nick} | 等级: Lv.{role_info.level} | 服务器: {role_info.server_name or '未知'}")
+        LOG.info(f"动态参数: appKey={bot.app_key}, roleId={bot.role_id[:16]}..., actId={bot.act_id[:16]}...")
+    else:
+        LOG.warning("警告: 无法获取角色信息，将使用默认配置")
+
+
+def is_visit_activity_task(task: Task) -> bool:
+    return "访问" in task.title and "活动" in task.title
 
-        # 分享卡片增加机会
-        bot.share_card()
 
-        # 执行任务
-        print(f"\n[{nick}] --- 任务列表 ---")
-        def is_visit_activity_task(task: Dict[str, Any]) -> bool:
-            title = (task.get("title") or "")
-            return "访问" in title and "活动" in title
+def is_send_card_task(task: Task) -> bool:
+    return "送出" in task.title and "卡" in task.title
 
-        def is_send_card_task(task: Dict[str, Any]) -> bool:
-            title = (task.get("title") or "")
-            return "\u9001\u51fa" in title and "\u5361" in title
 
-        tasks = bot.get_tasks()
-        if any(is_visit_activity_task(t) and not t.get("completed") for t in tasks):
+def claim_task(bot: DSAutomator, task: Task) -> List[str]:
+    """执行并领取单个任务，返回日志行（任务并发处理，日志按任务顺序输出）"""
+    if DEADLINE.expired():
+        DEADLINE.skip(f"{bot.name}: 任务 {task.title}")
+        return []
+    status = "已完成" if task.completed else "未开始"
+    reward_got = "已领取" if task.already_got else "未领取"
+    lines = [f"任务: {task.title} | 状态: {status} | 奖励: {reward_got}"]
+
+    if not task.completed:
+        # 送卡任务由互赠完成，这里不执行
+        if is_send_card_task(task):
+            return lines
+        do_res = bot.do_task(task.as_id)
+        lines.append(f"  -> 任务执行: {do_res.get('errmsg', '成功')}")
+        # 执行任务后立即尝试领取奖励（任务可能已完成）
+        sleep(0.5)
+        prize_res = bot.apply_prize(task.as_id)
+        if prize_res.get('code') == 200:
+            lines.append(f"  -> 奖励领取: OK")
+        return lines
+
+    prize_res = bot.apply_prize(task.as_id)
+    lines.append(f"  -> 奖励领取: {prize_res.get('errmsg', '成功')}")
+    return lines
+
+
+def task_steps(bot: DSAutomator) -> List[Step]:
+    """
+    每日任务的步骤：分享后加载任务列表；访问活动任务未完成时才访问并重新加载，
+    最后并发执行 / 领取各任务。
+    """
+    def share(results):
+        with PROFILER.phase("tasks"):
+            return bot.share_card()
+
+    def load(results):
+        with PROFILER.phase("tasks"):
+            return bot.get_tasks()
+
+    def visit(results):
+        # 以服务端任务状态为准：访问任务已完成（或没有该任务）时不再访问
+        tasks = results["加载任务"]
+        if not any(is_visit_activity_task(t) and not t.completed for t in tasks):
+            return tasks
+        with PROFILER.phase("tasks"):
             bot.visit_activity()
-            tasks = bot.get_tasks()
-        for task in tasks:
-            if task.get("alreadyGot"):
-                continue
-            status = "已完成" if task.get("completed") else "未开始"
-            reward_got = "已领取" if task.get("alreadyGot") else "未领取"
-            print(f"任务: {task.get('title')} | 状态: {status} | 奖励: {reward_got}")
-            
-            if not task.get("completed"):
-                if is_send_card_task(task):
-                    continue
-                do_res = bot.do_task(task.get("asId"))
-                print(f"  -> 任务执行: {do_res.get('errmsg', '成功')}")
-                # 执行任务后立即尝试领取奖励（任务可能已完成）
-                time.sleep(0.5)
-                prize_res = bot.apply_prize(task.get("asId"))
-                if prize_res.get('code') == 200:
-                    print(f"  -> 奖励领取: OK")
-                continue
-                
-            if task.get("completed") and not task.get("alreadyGot"):
-                prize_res = bot.apply_prize(task.get("asId"))
-                print(f"  -> 奖励领取: {prize_res.get('errmsg', '成功')}")
-
-        # 抽奖
-        print(f"\n[{nick}] --- 开始抽奖 ---")
-        if not bot.luck_draw_as_id:
-            print(f"[{nick}] 未获取到抽奖模块ID(asId)，跳过抽奖")
-            return
-        print(f"[{nick}] 抽奖模块 asId: {bot.luck_draw_as_id}")
-        win_prizes: List[str] = []
+            return bot.get_tasks()
+
+    def claim(results):
+        LOG.info(f"\n[{bot.nick}] --- 任务列表 ---")
+        tasks = [t for t in results["访问活动"] if not t.already_got]
+        with PROFILER.phase("tasks"):
+            for lines in run_concurrently(lambda t: claim_task(bot, t), tasks):
+                for line in lines:
+                    LOG.info(line)
+
+    return [
+        Step("分享", share),
+        Step("加载任务", load, ("分享",)),
+        Step("访问活动", visit, ("加载任务",)),
+        Step("任务", claim, ("访问活动",)),
+    ]
+
+
+def run_tasks(bot: DSAutomator) -> None:
+    """分享卡片，执行并领取每日任务"""
+    run_steps(task_steps(bot), bot.name)
+
+
+def run_draws(bot: DSAutomator) -> Optional[List[str]]:
+    """用完所有抽奖机会，返回中奖奖品；没有抽奖模块时返回 None"""
+    nick = bot.nick
+    LOG.info(f"\n[{nick}] --- 开始抽奖 ---")
+    if not bot.luck_draw_as_id:
+        LOG.info(f"[{nick}] 未获取到抽奖模块ID(asId)，跳过抽奖")
+        return None
+    LOG.info(f"[{nick}] 抽奖模块 asId: {bot.luck_draw_as_id}")
+    win_prizes: List[str] = []
+    draws = 0
+    with PROFILER.phase("draw"):
         while True:
             draw_info = bot.get_draw_info()
             chances = draw_info.get('myLeftDrawChance', 0)
             if chances <= 0:
-                print("没有剩余抽奖机会。")
+                LOG.debug("没有剩余抽奖机会。")
                 break
-            
+            if DEADLINE.expired():
+                DEADLINE.skip(f"{bot.name}: 剩余 {chances} 次抽奖")
+                break
+
             res = bot.draw()
+            draws += 1
             if res.get("isWin"):
                 prize = res.get("winPrize", {})
                 prize_name = prize.get("prizeName") or prize.get("name") or "未知奖品"
                 win_prizes.append(prize_name)
-                print(f"恭喜！抽到: {prize_name}")
+                LOG.debug(f"恭喜！抽到: {prize_name}")
             else:
-                print("此次未中奖。")
-            time.sleep(1)
+                LOG.debug("此次未中奖。")
+            sleep(1)
 
-        if win_prizes:
-            send_notify(
-                "集卡抽奖中奖",
-                f"{nick}抽到:\n" + "\n".join(f"- {p}" for p in win_prizes),
-            )
+    if draws:
+        LOG.info(f"抽奖 {draws} 次，中奖: {', '.join(win_prizes) if win_prizes else '无'}")
+    else:
+        LOG.info("没有剩余抽奖机会。")
+
+    if win_prizes:
+        send_notify(
+            "集卡抽奖中奖",
+            f"{nick}抽到:\n" + "\n".join(f"- {p}" for p in win_prizes),
+        )
+    return win_prizes
+
+
+def show_cards(bot: DSAutomator) -> CardSnapshot:
+    """获取并打印卡片状态，同时写入活动库存矩阵；返回 myCard 快照"""
+    LOG.info(f"\n[{bot.nick}] --- 卡片状态 ---")
+    card_data = bot.get_my_cards()
+    bot.activity.inventory.add(bot.name, card_data.cards)
+    owned = [f"{c.name}({c.num})" for c in card_data.cards if c.num > 0]
+    missing = [c.name for c in card_data.missing()]
+    LOG.info(f"已拥有: {', '.join(owned) if owned else '无'}")
+    LOG.info(f"缺少: {', '.join(missing) if missing else '无'}")
+    return card_data
+
+
+def run_mileposts(bot: DSAutomator, card_data: Optional[CardSnapshot] = None) -> List[str]:
+    """领取里程碑奖励"""
+    nick = bot.nick
+    LOG.info(f"\n[{nick}] --- 领取里程碑奖励 ---")
+    with PROFILER.phase("claim_all_milepost_rewards"):
+        milepost_prizes = bot.claim_all_milepost_rewards(card_data)
+    if milepost_prizes:
+        LOG.info(f"里程碑奖励: {', '.join(milepost_prizes)}")
+        send_notify(
+            "集卡里程碑奖励",
+            f"{nick}领取了:\n" + "\n".join(f"- {p}" for p in milepost_prizes),
+        )
+    else:
+        LOG.info("暂无可领取的里程碑奖励")
+    return milepost_prizes
 
-        # 显示卡片状态
-        print(f"\n[{nick}] --- 卡片状态 ---")
-        card_data = bot.get_my_cards()
-        card_infos = card_data.get('cardInfos', [])
-        owned = [f"{c.get('name')}({c.get('num', 0)})" for c in card_infos if (c.get('num') or 0) > 0]
-        missing = [c.get('name') for c in card_infos if (c.get('num') or 0) == 0]
-        print(f"已拥有: {', '.join(owned) if owned else '无'}")
-        print(f"缺少: {', '.join(missing) if missing else '无'}")
-
-        # 领取里程碑奖励
-        print(f"\n[{nick}] --- 领取里程碑奖励 ---")
-        milepost_prizes = bot.claim_all_milepost_rewards()
-        if milepost_prizes:
-            print(f"里程碑奖励: {', '.join(milepost_prizes)}")
-            send_notify(
-                "集卡里程碑奖励",
-                f"{nick}领取了:\n" + "\n".join(f"- {p}" for p in milepost_prizes),
-            )
-        else:
-            print("暂无可领取的里程碑奖励")
 
-    def pair_exchange_cards(bot_a: DSAutomator, bot_b: DSAutomator):
-        """
-        两个账号互相赠送卡片。
-        策略: 
-        1. A 有多余的且 B 缺少的卡 -> A 送给 B
-        2. B 有多余的且 A 缺少的卡 -> B 送给 A
-        3. 如果没有缺少的卡，就互相送数量最多的卡（为完成任务获取抽奖机会）
-        """
-        # 确保两个账号都初始化
+def run_daily_tasks(bot: DSAutomator):
+    """执行单个账号的每日任务"""
+    if not initialize_bot(bot):
+        return
+    print_account_header(bot)
+    # 抽奖机会来自任务奖励，卡片状态反映抽到的卡，里程碑按卡片状态领取；
+    # 时间紧张时跳过卡片列表（非必要），里程碑自行获取快照
+    steps = task_steps(bot) + [
+        Step("抽奖", lambda results: run_draws(bot), ("任务",)),
+        Step("卡片状态", lambda results: show_cards(bot), ("抽奖",), optional=True),
+        Step("里程碑", lambda results: run_mileposts(bot, results["卡片状态"]), ("卡片状态",)),
+    ]
+    if "里程碑" in run_steps(steps, bot.name):
+        bot.state_record()["done"] = today()
+
+
+def pair_exchange_cards(bot_a: DSAutomator, bot_b: DSAutomator):
+    """
+    两个账号互相赠送卡片。
+    策略: 
+    1. A 有多余的且 B 缺少的卡 -> A 送给 B
+    2. B 有多余的且 A 缺少的卡 -> B 送给 A
+    3. 如果没有缺少的卡，就互相送数量最多的卡（为完成任务获取抽奖机会）
+    """
+    # 确保两个账号都初始化
+    with PROFILER.phase("initialize"):
         if not bot_a._initialized:
             bot_a.initialize()
         if not bot_b._initialized:
             bot_b.initialize()
 
-        # 获取角色名作为显示名称
-        a_role = bot_a.get_role_info()
-        b_role = bot_b.get_role_info()
-        a_nick = a_role.get("nick") or bot_a.name if a_role else bot_a.name
-        b_nick = b_role.get("nick") or bot_b.name if b_role else bot_b.name
-
-        print(f"\n{'='*60}")
-        print(f"[配对赠送] {a_nick} <-> {b_nick}")
-        print(f"{'='*60}")
-
-        # 获取双方的卡片信息
-        a_giftable = bot_a.get_giftable_cards()
-        a_missing = bot_a.get_missing_cards()
-        b_giftable = bot_b.get_giftable_cards()
-        b_missing = bot_b.get_missing_cards()
-
-        print(f"\n[{a_nick}] 可赠送: {[c['name'] + '(' + str(c['num']) + ')' for c in a_giftable]}")
-        print(f"[{a_nick}] 缺少: {[c['name'] for c in a_missing]}")
-        print(f"[{b_nick}] 可赠送: {[c['name'] + '(' + str(c['num']) + ')' for c in b_giftable]}")
-        print(f"[{b_nick}] 缺少: {[c['name'] for c in b_missing]}")
-
-        def do_gift(sender: DSAutomator, receiver: DSAutomator, sender_nick: str, receiver_nick: str, card: Dict[str, Any], reason: str):
-            """执行赠送"""
-            print(f"\n[{sender_nick}] -> [{receiver_nick}] {reason}: {card['name']}")
-            give_res = sender.post_give_wish(card['id'])
-            if give_res.get('code') == 200 and give_res.get('result', {}).get('interchangeWishId'):
-                wish_id = give_res['result']['interchangeWishId']
-                print(f"  赠送发起成功, wishId: {wish_id[:16]}...")
-                time.sleep(0.5)
-                
-                accept_res = receiver.accept_give_wish(wish_id)
-                if accept_res.get('code') == 200:
-                    print(f"  [{receiver_nick}] 领取成功!")
-                    return True
-                else:
-                    print(f"  [{receiver_nick}] 领取失败: {accept_res.get('errmsg')}")
+    a_nick = bot_a.nick
+    b_nick = bot_b.nick
+
+    LOG.info(f"\n{'='*60}")
+    LOG.info(f"[配对赠送] {a_nick} <-> {b_nick}")
+    LOG.info(f"{'='*60}")
+
+    # 获取双方的卡片信息（每个账号一次 myCard）
+    a_cards = bot_a.get_my_cards()
+    b_cards = bot_b.get_my_cards()
+    a_giftable, a_missing = a_cards.giftable(), a_cards.missing()
+    b_giftable, b_missing = b_cards.giftable(), b_cards.missing()
+
+    LOG.info(f"\n[{a_nick}] 可赠送: {[f'{c.name}({c.num})' for c in a_giftable]}")
+    LOG.info(f"[{a_nick}] 缺少: {[c.name for c in a_missing]}")
+    LOG.info(f"[{b_nick}] 可赠送: {[f'{c.name}({c.num})' for c in b_giftable]}")
+    LOG.info(f"[{b_nick}] 缺少: {[c.name for c in b_missing]}")
+
+    executor = GiftExecutor()
+    sides = {
+        bot_a: (a_giftable, b_missing),
+        bot_b: (b_giftable, a_missing),
+    }
+    sent = {bot_a: False, bot_b: False}
+    tried: Dict[DSAutomator, set] = {bot_a: set(), bot_b: set()}
+    transfers = [plan_gift(bot_a, bot_b, *sides[bot_a]), plan_gift(bot_b, bot_a, *sides[bot_b])]
+    transfers = [t for t in transfers if t]
+    try:
+        while transfers:
+            if DEADLINE.near():
+                DEADLINE.skip(f"{a_nick} <-> {b_nick}: 赠送")
+                break
+            LOG.info()
+            retry: List[Optional[GiftTransfer]] = []
+            for r in executor.execute(transfers):
+                t = r.transfer
+                tried[t.sender].add(t.card_id)
+                if r.ok:
+                    sent[t.sender] = True
+                elif not r.wish_id:
+                    # 发起失败时改送其他卡
+                    retry.append(plan_gift(t.sender, t.receiver, *sides[t.sender], exclude=tried[t.sender]))
+            transfers = [t for t in retry if t]
+    finally:
+        # 中途出错或收尾时，已发起未领取的赠送留给下次运行领取
+        save_pending_wishes(executor)
+
+    # 总结
+    a_sent, b_sent = sent[bot_a], sent[bot_b]
+    LOG.info(f"\n[赠送结果] {a_nick}: {'已送出' if a_sent else '未送出'} | {b_nick}: {'已送出' if b_sent else '未送出'}")
+
+
+def save_pending_wishes(executor: GiftExecutor) -> None:
+    """已发起但未领取的赠送记入本地缓存，下次运行由接收方继续领取"""
+    for r in executor.unaccepted():
+        receiver = r.transfer.receiver
+        with STATE.lock:
+            STATE.activity(receiver.card_book_id).setdefault("pending_wishes", []).append({
+                "wishId": r.wish_id,
+                "receiver": receiver._state_key(),
+                "card": r.transfer.card_name,
+            })
+
+
+def safe_accept(bot: DSAutomator, wish_id: str) -> Dict[str, Any]:
+    """领取赠送；网络异常时按本地失败（code -1）返回，赠送保留到下次再领"""
+    try:
+        return bot.accept_give_wish(wish_id)
+    except Exception as e:
+        return {"code": -1, "errmsg": str(e)}
+
+
+def accept_saved_wishes(bots: List[DSAutomator]) -> None:
+    """领取之前运行中断而遗留的赠送"""
+    by_key = {b._state_key(): b for b in bots}
+    for activity in {b.activity for b in bots if b.activity}:
+        cache = STATE.activity(activity.card_book_id)
+        saved = cache.get("pending_wishes") or []
+        mine = [w for w in saved if w.get("receiver") in by_key]
+        if not mine:
+            continue
+        LOG.info(f"\n[遗留赠送] 继续领取 {len(mine)} 个未完成的赠送")
+        results = run_concurrently(lambda w: safe_accept(by_key[w["receiver"]], w["wishId"]), mine)
+        keep = [w for w in saved if w not in mine]
+        for w, res in zip(mine, results):
+            if res.get('code') == 200:
+                LOG.info(f"  [{by_key[w['receiver']].nick}] 领取成功: {w.get('card')}")
+            elif res.get('code') == -1:
+                keep.append(w)  # 本地/签名失败，下次再试
             else:
-                print(f"  赠送发起失败: {give_res.get('errmsg')}")
-            return False
+                LOG.warning(f"  [{by_key[w['receiver']].nick}] 领取失败: {res.get('errmsg')}")
+        cache["pending_wishes"] = keep
 
-        a_sent = False  # A是否已送出
-        b_sent = False  # B是否已送出
-
-        # --- A 送给 B ---
-        b_missing_ids = {c['id'] for c in b_missing}
-        # 策略1: 优先送 B 缺少的卡
-        for card in a_giftable:
-            if card['id'] in b_missing_ids:
-                if do_gift(bot_a, bot_b, a_nick, b_nick, card, "赠送缺少的卡"):
-                    a_sent = True
-                time.sleep(1)
-                break
-        
-        # 策略2: 如果 B 不缺卡，送数量最多的（为了完成任务）
-        if not a_sent and a_giftable:
-            # 按数量排序，送最多的
-            sorted_cards = sorted(a_giftable, key=lambda x: x['num'], reverse=True)
-            card = sorted_cards[0]
-            if do_gift(bot_a, bot_b, a_nick, b_nick, card, "赠送数量最多的卡(完成任务)"):
-                a_sent = True
-            time.sleep(1)
-
-        # --- B 送给 A ---
-        a_missing_ids = {c['id'] for c in a_missing}
-        # 策略1: 优先送 A 缺少的卡
-        for card in b_giftable:
-            if card['id'] in a_missing_ids:
-                if do_gift(bot_b, bot_a, b_nick, a_nick, card, "赠送缺少的卡"):
-                    b_sent = True
-                time.sleep(1)
-                break
-        
-        # 策略2: 如果 A 不缺卡，送数量最多的（为了完成任务）
-        if not b_sent and b_giftable:
-            sorted_cards = sorted(b_giftable, key=lambda x: x['num'], reverse=True)
-            card = sorted_cards[0]
-            if do_gift(bot_b, bot_a, b_nick, a_nick, card, "赠送数量最多的卡(完成任务)"):
-                b_sent = True
-            time.sleep(1)
 
-        # 总结
-        print(f"\n[赠送结果] {a_nick}: {'已送出' if a_sent else '未送出'} | {b_nick}: {'已送出' if b_sent else '未送出'}")
+def run_exchange(bots: List[DSAutomator]) -> None:
+    """
+    按组配对互相赠送卡片 (1-2, 3-4, 5-6 ...)。
+    赠送接口不带角色字段，卡片按账号收发：同一账号的多个角色（NARAKA_ROLES）
+    只由第一个实例（默认角色）参与配对，避免账号给自己的另一个角色赠送。
+    """
+    LOG.info(f"\n\n{'#'*60}")
+    LOG.info("# 开始配对互相赠送卡片")
+    LOG.info(f"{'#'*60}")
 
-    # =============================================================================
-    # 主逻辑
-    # =============================================================================
-    
-    # 创建所有 bot 实例
-    bots = [create_bot(acc) for acc in ACCOUNTS]
+    for bot in bots:
+        try:
+            bot.get_role_info()
+        except Exception as e:
+            LOG.error(f"[{bot.name}] 获取角色信息出错: {e}")
+    accept_saved_wishes(bots)
 
-    # 1. 按组配对互相赠送卡片 (1-2, 3-4, 5-6 ...)
-    if EXCHANGE_CARDS:
-        print(f"\n\n{'#'*60}")
-        print("# 开始配对互相赠送卡片")
-        print(f"{'#'*60}")
-        
-        for i in range(0, len(bots) - 1, 2):
-            bot_a = bots[i]
-            bot_b = bots[i + 1]
+    by_uid: Dict[str, DSAutomator] = {}
+    for bot in bots:
+        by_uid.setdefault(bot.uid, bot)
+    members = list(by_uid.values())
+
+    def run_pair(pair: Tuple[DSAutomator, DSAutomator]):
+        bot_a, bot_b = pair
+        if DEADLINE.near():
+            DEADLINE.skip(f"{bot_a.name} <-> {bot_b.name}: 互赠")
+            return
+        with LOG.block(f"{bot_a.name} <-> {bot_b.name}"):
             try:
-                pair_exchange_cards(bot_a, bot_b)
+                with PROFILER.phase("pair_exchange_cards"):
+                    pair_exchange_cards(bot_a, bot_b)
             except Exception as e:
-                print(f"[{bot_a.name} <-> {bot_b.name}] 互赠出错: {e}")
-            time.sleep(2)
+                LOG.error(f"[{bot_a.name} <-> {bot_b.name}] 互赠出错: {e}")
+
+    pairs = [(members[i], members[i + 1]) for i in range(0, len(members) - 1, 2)]
+    run_concurrently(run_pair, pairs, WORKERS)
+
+    # 如果账号数量是奇数，最后一个账号没有配对
+    if len(members) % 2 == 1:
+        LOG.info(f"\n[提示] {members[-1].name} 是奇数账号，没有配对对象")
+
+
+def fetch_status(bot: DSAutomator) -> Optional[Dict[str, Any]]:
+    """
+    只读获取账号状态（待领任务奖励、抽奖机会、库存、可领取里程碑），不做任何修改。
+    结果同时写入本地缓存，供账号调度使用。
+    """
+    if not bot.initialize():
+        return None
+    tasks = bot.get_tasks()
+    draw_info = bot.get_draw_info() if bot.luck_draw_as_id else {}
+    card_data = bot.get_my_cards()
+    bot.activity.inventory.add(bot.name, card_data.cards)
+    status = {
+        "name": bot.name,
+        "nick": bot.nick,
+        "task_prizes": sum(1 for t in tasks if t.completed and not t.already_got),
+        "chances": draw_info.get('myLeftDrawChance', 0) or 0,
+        "owned": card_data.owned,
+        "total": len(card_data.cards),
+        "duplicates": sum(c.can_give for c in card_data.cards),
+        "mileposts": sum(1 for m in card_data.mileposts if m.state == 'UN_RECEIVE'),
+    }
+    bot.state_record()["scan"] = dict(status, date=today())
+    return status
+
+
+def safe_fetch_status(bot: DSAutomator) -> Optional[Dict[str, Any]]:
+    """fetch_status，出错时记录日志并返回 None（与初始化失败同样处理）"""
+    try:
+        return fetch_status(bot)
+    except Exception as e:
+        LOG.error(f"[{bot.name}] 获取状态出错: {e}")
+        return None
+
+
+def print_status_table(bots: List[DSAutomator], rows: List[Optional[Dict[str, Any]]]) -> None:
+    widths = [16, 16, 10, 10, 10, 8, 12]
+    LOG.info(format_row(["账号", "角色", "待领任务", "抽奖机会", "已集卡", "重复", "可领里程碑"], widths))
+    for bot, row in zip(bots, rows):
+        if row is None:
+            LOG.info(format_row([bot.name, "初始化失败", "-", "-", "-", "-", "-"], widths))
+            continue
+        LOG.info(format_row([
+            row["name"], row["nick"], str(row["task_prizes"]), str(row["chances"]), f"{row['owned']}/{row['total']}",
+            str(row["duplicates"]), str(row["mileposts"]),
+        ], widths))
 
-        # 如果账号数量是奇数，最后一个账号没有配对
-        if len(bots) % 2 == 1:
-            print(f"\n[提示] {bots[-1].name} 是奇数账号，没有配对对象")
-    else:
-        print(f"\n\n[提示] 互赠卡片功能已关闭 (NARAKA_EXCHANGE_CARDS=False)")
 
-    # 2. 再执行每个账号的每日任务
+def export_report(activity: ActivityContext, multiple: bool) -> None:
+    """打印并按配置导出活动的库存统计"""
+    print_inventory_report(activity.inventory)
+    if not REPORT_FILE:
+        return
+    report_file = REPORT_FILE
+    if multiple:
+        root, ext = os.path.splitext(REPORT_FILE)
+        report_file = f"{root}-{activity.card_book_id}{ext}"
+    try:
+        activity.inventory.export(report_file)
+        LOG.info(f"[报表] 已导出: {report_file}")
+    except OSError as e:
+        LOG.warning(f"[报表] 导出失败: {e}")
+
+
+def today() -> str:
+    return time.strftime("%Y-%m-%d")
+
+
+def priority_score(scan: Dict[str, Any]) -> float:
+    """
+    账号待处理价值：待领任务奖励、剩余抽奖机会、可领里程碑，以及接近集齐的程度。
+    """
+    score = 3.0 * scan.get("task_prizes", 0) + 2.0 * scan.get("chances", 0) + 4.0 * scan.get("mileposts", 0)
+    missing = scan.get("total", 0) - scan.get("owned", 0)
+    if 0 < missing <= 3:
+        score += 4 - missing
+    return score
+
+
+SCAN_BUDGET_SHARE = 0.2  # 预扫描最多占用剩余时间预算的比例
+SCAN_REQUESTS = 4  # 预扫描每个账号依次发出的请求数（初始化、taskInfo、luckDrawInfo、myCard）
+
+
+def schedule_accounts(bots: List[DSAutomator], mode: str = "") -> List[DSAutomator]:
+    """
+    按待处理价值从高到低排序账号，运行时间有限时最有价值的工作先完成。
+    - 今天已完成的账号排在最后
+    - 今天扫描过的账号（status 或之前的预扫描）直接使用缓存
+    - 其余账号按 mode 决定是否并发预扫描；不扫描时只按缓存中的缺卡数估计
+    预扫描要为每个账号多请求一轮 taskInfo / luckDrawInfo / myCard，
+    auto 只在时间预算可能不够处理全部账号时（设置了 NARAKA_DEADLINE）才预扫描；
+    预扫描最多占用剩余预算的 SCAN_BUDGET_SHARE：按近期请求延迟估计耗时，放不下时整体跳过，
+    超时后不再开始新的扫描，来不及扫描的账号同样按缓存估计。
+    """
+    mode = mode or SCHEDULE_MODE
+    if mode == "off" or len(bots) <= 1:
+        return bots
+    live = mode == "live" or (mode == "auto" and DEADLINE.budget > 0 and len(bots) > WORKERS)
+    live = live and not DEADLINE.near()
+    date = today()
+    scores: Dict[DSAutomator, float] = {}
+    estimates: Dict[DSAutomator, float] = {}
+    to_scan: List[DSAutomator] = []
     for bot in bots:
         try:
-            run_daily_tasks(bot)
+            bot.get_role_info()
+        except Exception as e:
+            LOG.error(f"[{bot.name}] 获取角色信息出错: {e}")
+            scores[bot] = 0.0
+            continue
+        record = bot.state_record()
+        scan = record.get("scan") or {}
+        if record.get("done") == date:
+            scores[bot] = -1.0
+        elif scan.get("date") == date:
+            scores[bot] = priority_score(scan)
+        else:
+            estimates[bot] = priority_score({"owned": scan.get("owned", 0), "total": scan.get("total", 0)})
+            if live:
+                to_scan.append(bot)
+            else:
+                scores[bot] = estimates[bot]
+    scan_budget = DEADLINE.remaining() * SCAN_BUDGET_SHARE
+    scan_cost = LIMITER.latency() * SCAN_REQUESTS * max(1.0, len(to_scan) / LIMITER.limit)
+    if to_scan and scan_cost > scan_budget:
+        LOG.info(f"[调度] 预扫描预计 {scan_cost:.1f}s，超出可用时间 {scan_budget:.1f}s，按缓存估计")
+        scores.update((bot, estimates[bot]) for bot in to_scan)
+        to_scan = []
+    if to_scan:
+        LOG.info(f"[调度] 预扫描 {len(to_scan)} 个账号...")
+        stop_at = time.monotonic() + scan_budget
+
+        def scan_bot(bot: DSAutomator) -> Optional[float]:
+            if DEADLINE.near() or time.monotonic() >= stop_at:
+                return None
+            status = safe_fetch_status(bot)
+            return priority_score(status) if status else 0.0
+
+        unscanned = 0
+        for bot, score in zip(to_scan, run_concurrently(scan_bot, to_scan, MAX_CONCURRENCY)):
+            if score is None:
+                unscanned += 1
+                score = estimates[bot]
+            scores[bot] = score
+        if unscanned:
+            LOG.info(f"[调度] 时间有限，{unscanned} 个账号未预扫描，按缓存估计")
+    ordered = sorted(bots, key=lambda b: -scores[b])
+    if ordered != bots:
+        LOG.info("[调度] 执行顺序: " + ", ".join(f"{b.name}({scores[b]:g})" for b in ordered))
+    return ordered
+
+
+# =============================================================================
+# 多进程模式（NARAKA_PROCESSES）：账号分组到子进程，结果经紧凑的 IPC 交回父进程
+# =============================================================================
+
+
+class WorkerResult(NamedTuple):
+    """子进程交回父进程的结果（只含汇总需要的数据）"""
+    ledger: Dict[str, Any]                                     # {账号key: {cardBookId: 账号缓存}}
+    activities: Dict[str, Any]                                 # {cardBookId: 里程碑定义与待领取赠送}
+    inventory: Dict[str, List[Tuple[str, Tuple[Card, ...]]]]   # {cardBookId: [(账号名, 库存)]}
+    notify: List[Tuple[str, str]]                              # 中奖、里程碑等待发送的通知
+    skipped: List[str]                                         # 因时间预算跳过的工作
+    counters: Tuple[int, int, int, float]                      # 请求统计
+
+
+def chunk_accounts(accounts: List[Any], n: int) -> List[List[Any]]:
+    """把账号连续地分成至多 n 组，互赠配对 (1-2, 3-4 ...) 不会被拆到两个进程"""
+    pairs = [accounts[i:i + 2] for i in range(0, len(accounts), 2)]
+    n = max(1, min(n, len(pairs)))
+    size, extra = divmod(len(pairs), n)
+    chunks, start = [], 0
+    for i in range(n):
+        end = start + size + (1 if i < extra else 0)
+        chunks.append([acc for pair in pairs[start:end] for acc in pair])
+        start = end
+    return chunks
+
+
+def process_worker(command_name: str, chunk: List[Tuple[str, str, str, str]],
+                   specs: List[Tuple[str, str, str, str, str, List[str]]],
+                   budget: float, margin: float, max_concurrency: int) -> WorkerResult:
+    """子进程入口：用独立的限流器、时间预算和活动上下文处理一组账号"""
+    global LIMITER, DEADLINE, ACTIVITIES
+    LIMITER = AdaptiveLimiter(max_limit=max_concurrency)
+    DEADLINE = RunDeadline(budget, margin)
+    ACTIVITIES = ActivityRegistry()
+    PROFILER.enabled = False
+    with _NOTIFY_LOCK:
+        _NOTIFY_QUEUE.clear()
+
+    activities = ACTIVITIES.restore(specs)
+    accounts = [create_bot(acc) for acc in chunk]
+    bots = run_activities(COMMANDS[command_name][0], accounts, activities, report=False)
+
+    ledger, states = STATE.snapshot([b._state_key() for b in bots], [a.card_book_id for a in activities])
+    with _NOTIFY_LOCK:
+        notify = list(_NOTIFY_QUEUE)
+    return WorkerResult(
+        ledger, states,
+        {a.card_book_id: a.inventory.rows() for a in activities},
+        notify, list(DEADLINE.skipped), LIMITER.counters(),
+    )
+
+
+def merge_worker_result(result: WorkerResult) -> None:
+    """把子进程结果并入父进程的状态缓存、库存矩阵、通知队列和统计"""
+    STATE.merge(result.ledger, result.activities)
+    for book_id, rows in result.inventory.items():
+        inventory = ACTIVITIES.get(book_id).inventory
+        for account, cards in rows:
+            inventory.add(account, cards)
+    for title, content in result.notify:
+        send_notify(title, content)
+    for what in result.skipped:
+        DEADLINE.skip(what)
+    LIMITER.absorb(result.counters)
+
+
+def run_in_processes(command_name: str, selected: List[Tuple[str, str, str, str]],
+                     accounts: List[DSAutomator], activities: List[ActivityContext]) -> None:
+    """
+    账号分组后交给子进程，每个子进程内照常并发处理自己的账号。
+    活动元数据由父进程解析一次再下发；并发上限按进程数均分。
+    每组使用单独的单进程进程池：某个子进程崩溃只丢失这一组的结果，其他组照常合并。
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    for activity in activities:
+        first_ready(accounts, activity)
+    specs = [a.spec() for a in activities]
+    chunks = chunk_accounts(selected, PROCESSES)
+    LOG.info(f"\n[多进程] {len(selected)} 个账号分到 {len(chunks)} 个子进程")
+
+    STATE.save()  # spawn 方式启动的子进程从文件读取缓存
+    remaining = DEADLINE.remaining()
+    budget = 0.0 if remaining == float("inf") else max(remaining, 1e-3)
+    per_process = max(1, MAX_CONCURRENCY // len(chunks))
+    # fork 启动最快，且子进程直接继承已加载的模块；不支持的平台用默认方式
+    method = "fork" if "fork" in multiprocessing.get_all_start_methods() else None
+    context = multiprocessing.get_context(method)
+    pools = [ProcessPoolExecutor(1, mp_context=context) for _ in chunks]
+    try:
+        futures = [
+            pool.submit(process_worker, command_name, chunk, specs, budget, DEADLINE.margin, per_process)
+            for pool, chunk in zip(pools, chunks)
+        ]
+        for idx, (chunk, future) in enumerate(zip(chunks, futures), 1):
+            try:
+                merge_worker_result(future.result())
+            except Exception as e:
+                names = ", ".join(acc[3] for acc in chunk)
+                LOG.error(f"[多进程] 子进程 {idx} 出错，未合并其结果 ({names}): {e}")
+    finally:
+        for pool in pools:
+            pool.shutdown()
+
+
+# =============================================================================
+# 子命令
+# =============================================================================
+
+
+def cmd_run(bots: List[DSAutomator]) -> None:
+    """完整流程：互赠 -> 每日任务 -> 抽奖 -> 卡片状态 -> 里程碑"""
+    # 1. 按组配对互相赠送卡片
+    if EXCHANGE_CARDS:
+        run_exchange(bots)
+    else:
+        LOG.info(f"\n\n[提示] 互赠卡片功能已关闭 (NARAKA_EXCHANGE_CARDS=False)")
+
+    # 2. 再按优先级执行每个账号的每日任务
+    for_each_account(schedule_accounts(bots), run_daily_tasks)
+
+
+def cmd_status(bots: List[DSAutomator]) -> None:
+    """并发查询所有账号的库存与抽奖机会（只读）"""
+    rows = run_concurrently(safe_fetch_status, bots, MAX_CONCURRENCY)
+    LOG.info()
+    print_status_table(bots, rows)
+
+
+def cmd_draw(bots: List[DSAutomator]) -> None:
+    for_each_account(schedule_accounts(bots), lambda bot: initialize_bot(bot) and run_draws(bot))
+
+
+def cmd_tasks(bots: List[DSAutomator]) -> None:
+    for_each_account(bots, lambda bot: initialize_bot(bot) and run_tasks(bot))
+
+
+def cmd_exchange(bots: List[DSAutomator]) -> None:
+    run_exchange(bots)
+
+
+def cmd_mileposts(bots: List[DSAutomator]) -> None:
+    for_each_account(schedule_accounts(bots), lambda bot: initialize_bot(bot) and run_mileposts(bot))
+
+
+# discover 需要活动列表，由 main 单独处理
+COMMANDS: Dict[str, Tuple[Optional[Callable[[List[DSAutomator]], None]], str]] = {
+    "run": (cmd_run, "完整执行所有流程（默认）"),
+    "status": (cmd_status, "只读查询所有账号的库存与抽奖机会"),
+    "draw": (cmd_draw, "只抽奖"),
+    "tasks": (cmd_tasks, "只分享并完成/领取每日任务"),
+    "exchange": (cmd_exchange, "只配对互赠卡片"),
+    "mileposts": (cmd_mileposts, "只领取里程碑奖励"),
+    "discover": (None, "只发现活动并打印活动配置"),
+}
+
+
+def cmd_discover(accounts: List[DSAutomator], activities: List[ActivityContext]) -> None:
+    """打印发现的活动及其模块配置（只读）"""
+    for activity in activities:
+        bot = first_ready(accounts, activity)
+        LOG.info(f"\n[活动] cardBookId: {activity.card_book_id}")
+        if bot is None:
+            LOG.info("  无法获取活动配置（没有可用账号）")
+            continue
+        LOG.info(f"  appKey: {activity.app_key or bot.app_key}")
+        LOG.info(f"  actId: {activity.act_id}")
+        LOG.info(f"  集卡模块 asId: {activity.card_as_id}")
+        LOG.info(f"  抽奖模块 asId: {activity.luck_draw_as_id or '无'}")
+        LOG.info(f"  任务模块 asId: {', '.join(activity.task_as_ids) or '无'}")
+
+
+def build_arg_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="网易大神小程序 - 集卡活动自动化脚本",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="子命令:\n" + "\n".join(f"  {name:<10} {desc}" for name, (_, desc) in COMMANDS.items()),
+    )
+    parser.add_argument("command", nargs="?", default="run", choices=list(COMMANDS), metavar="command",
+                        help="要执行的子命令，默认 run")
+    parser.add_argument("-a", "--account", action="append", default=[],
+                        help="只处理指定账号（名称/UID/序号，可重复或用逗号分隔）")
+    parser.add_argument("--profile", action="store_true", help="开启性能分析（同 NARAKA_PROFILE）")
+    return parser
+
+
+def run_activities(command: Callable[[List[DSAutomator]], None], accounts: List[DSAutomator],
+                   activities: List[ActivityContext], report: bool) -> List[DSAutomator]:
+    """在当前进程内对每个活动执行子命令，返回参与的账号实例"""
+    processed: List[DSAutomator] = []
+    for activity in activities:
+        # 每个账号（的各个角色）参与其拥有对应游戏角色的活动
+        bots = activity_bots(accounts, activity)
+        if len(activities) > 1:
+            LOG.info(f"\n\n{'*'*60}")
+            LOG.info(f"* 活动 cardBookId: {activity.card_book_id} ({len(bots)} 个账号)")
+            LOG.info(f"{'*'*60}")
+        if DEADLINE.near():
+            DEADLINE.skip(f"活动 {activity.card_book_id}")
+            continue
+        command(bots)
+        processed.extend(bots)
+        if report:
+            export_report(activity, len(activities) > 1)
+    return processed
+
+
+def finish_run() -> None:
+    """保存状态、发送通知并输出运行统计"""
+    STATE.save()
+    flush_notify()
+    if DEADLINE.budget > 0 or DEADLINE.stop_reason or DEADLINE.skipped:
+        LOG.info(f"\n[时间预算] {DEADLINE.summary()}")
+    LOG.info(f"\n[并发控制] {LIMITER.summary()}")
+
+    if PROFILER.enabled:
+        LOG.info(f"\n{'#'*60}")
+        LOG.info("# 性能分析")
+        LOG.info(f"{'#'*60}")
+        LOG.info(PROFILER.report())
+        if PROFILER.dump(PROFILE_OUT):
+            LOG.info(f"\n[性能分析] pstats 已保存: {PROFILE_OUT}")
+
+
+def install_signal_handlers() -> None:
+    """收到 SIGTERM/SIGINT 时进入收尾：不再开始新工作，完成已发起的赠送后正常退出"""
+    import signal
+
+    def handle(signum, frame):
+        if DEADLINE.stop_reason:
+            raise KeyboardInterrupt
+        DEADLINE.stop(f"收到信号 {signum}，提前收尾")
+        LOG.info(f"\n[时间预算] 收到信号 {signum}，停止开始新的工作并收尾")
+
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        try:
+            signal.signal(sig, handle)
+        except (ValueError, OSError):
+            pass
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_arg_parser().parse_args(argv)
+    if args.profile:
+        PROFILER.enable()
+    install_signal_handlers()
+
+    all_accounts = parse_accounts_from_env()
+    if not all_accounts:
+        LOG.error("[error] 未配置账号信息，请设置环境变量 NARAKA_TOKEN")
+        LOG.info("[info] 格式: TOKEN#UID#DEVICE_ID#名称，多个账号用 & 分隔")
+        return 1
+
+    LOG.info(f"[青龙面板] 从环境变量 NARAKA_TOKEN 读取到 {len(all_accounts)} 个账号")
+    selected = filter_accounts(all_accounts, args.account)
+    if not selected:
+        LOG.error(f"[error] 没有匹配的账号: {', '.join(args.account)}")
+        return 1
+    if len(selected) != len(all_accounts):
+        LOG.info(f"[账号筛选] 本次处理 {len(selected)} 个账号: {', '.join(acc[3] for acc in selected)}")
+
+    # 检查签名 API 是否配置
+    if SIGN_API_URL == "https://your-worker.workers.dev/api/sign":
+        LOG.error("[error] 未配置签名 API 地址，请设置环境变量 NARAKA_SIGN_API_URL")
+        LOG.info("[info] 示例: export NARAKA_SIGN_API_URL='https://xxx.workers.dev/api/sign'")
+        return 1
+
+    LOG.info(f"[签名API] {SIGN_API_URL}")
+
+    # 卡册ID：可选（未配置将自动发现）
+    if CARD_BOOK_IDS:
+        LOG.info(f"[活动配置] cardBookId: {', '.join(CARD_BOOK_IDS)}")
+    # =============================================================================
+
+    # 创建所有 bot 实例
+    accounts = [create_bot(acc) for acc in selected]
+
+    # 发现本次要处理的活动（整个运行只发现一次，失败则换下一个账号）
+    activities: List[ActivityContext] = []
+    for account in accounts:
+        try:
+            if account.get_role_info():
+                activities = ACTIVITIES.discover(account)
         except Exception as e:
-            print(f"[{bot.name}] 执行任务出错: {e}")
-        time.sleep(2)
+            LOG.error(f"[{account.name}] 发现活动出错: {e}")
+        if activities:
+            break
+    if not activities:
+        LOG.error("[error] 所有方式均无法发现卡册ID，可能当前没有进行中的集卡活动")
+        LOG.info("[info] 可手动设置 NARAKA_CARD_BOOK_ID 或等待新活动开始")
+        return 1
+
+    if args.command == "discover":
+        cmd_discover(accounts, activities)
+        return 0
+
+    report = args.command in ("run", "status")
+    try:
+        # status 只读且需要汇总成一张表，始终在当前进程内执行
+        if PROCESSES > 1 and args.command != "status" and len(selected) > 2:
+            run_in_processes(args.command, selected, accounts, activities)
+            if report:
+                for activity in activities:
+                    export_report(activity, len(activities) > 1)
+        else:
+            run_activities(COMMANDS[args.command][0], accounts, activities, report)
+    finally:
+        # 出错或再次收到信号强制中断时，同样保存遗留赠送等状态并发送已收集的通知
+        finish_run()
+
+    LOG.info(f"\n{'='*60}")
+    LOG.info("运行已提前收尾，跳过的工作见上方汇总" if DEADLINE.skipped else "所有账号处理完成！")
+    LOG.info(f"{'='*60}")
+    return 0
 
-    print(f"\n{'='*60}")
-    print("所有账号处理完成！")
-    print(f"{'='*60}")
+
+if __name__ == "__main__":
+    sys.exit(main())